@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Adaptive probe timeouts
+Tracks measured RTTs per /24 and derives timeouts from observed percentiles
+"""
+
+import math
+import threading
+from collections import deque
+
+class RttTracker:
+    def __init__(self, floor=0.2, ceiling=3.0, percentile=0.95, multiplier=3.0,
+                 window=32, min_subnet_samples=3, min_global_samples=20, max_subnets=65536):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.window = window
+        self.min_subnet_samples = min_subnet_samples
+        self.min_global_samples = min_global_samples
+        self.max_subnets = max_subnets
+        # /24 prefix -> recent RTTs, in insertion order; the lock guards adding and evicting
+        # subnets, appends to an existing deque are atomic
+        self.subnets = {}
+        self.subnets_lock = threading.Lock()
+        self.global_samples = deque(maxlen=window * 32)
+        self.global_timeout = None
+        self.observations = 0
+
+    def _timeout_from(self, samples):
+        """Scale a percentile of the samples and clamp it to [floor, ceiling]"""
+        ordered = sorted(samples)
+        rtt = ordered[min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)]
+        return min(self.ceiling, max(self.floor, rtt * self.multiplier))
+
+    def observe(self, ip_int, rtt):
+        """Record an RTT measured against an address"""
+        key = ip_int >> 8
+        samples = self.subnets.get(key)
+        if samples is None:
+            with self.subnets_lock:
+                samples = self.subnets.get(key)
+                if samples is None:
+                    if len(self.subnets) >= self.max_subnets:
+                        # Forget the subnet seen first
+                        del self.subnets[next(iter(self.subnets))]
+                    samples = self.subnets[key] = deque(maxlen=self.window)
+        samples.append(rtt)
+        self.global_samples.append(rtt)
+
+        self.observations += 1
+        if self.observations % self.window == 0 and len(self.global_samples) >= self.min_global_samples:
+            self.global_timeout = self._timeout_from(list(self.global_samples))
+
+    def timeout(self, ip_int):
+        """Timeout for an address: its /24's percentile, else the global one, else the ceiling"""
+        samples = self.subnets.get(ip_int >> 8)
+        if samples is not None and len(samples) >= self.min_subnet_samples:
+            return self._timeout_from(list(samples))
+        if self.global_timeout is not None:
+            return self.global_timeout
+        return self.ceiling
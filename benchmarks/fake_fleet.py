@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Fake fleet of JSON-RPC hosts on loopback addresses
+Every host of a 127.0.0.0/8 network gets a role: open, slow, malformed, blackhole or closed
+"""
+
+import json
+import random
+import asyncio
+import argparse
+import ipaddress
+
+ROLES = ["open", "slow", "malformed", "blackhole", "closed"]
+
+SYNCING_BODY = json.dumps({"jsonrpc": "2.0", "id": 1, "result": False}).encode()
+
+MALFORMED_BODIES = [
+    b"<html><body>404 Not Found</body></html>",
+    b'{"status": "ok"}',
+    b'{"jsonrpc": "2.0", "id": 1, "result"',
+]
+
+def assign_roles(network, ratios, seed=0):
+    """Map each host of the network to a role; the same inputs always give the same fleet"""
+    rng = random.Random(seed)
+    names = [role for role in ROLES if ratios.get(role)]
+    weights = [ratios[role] for role in names]
+    roles = {}
+    for ip in ipaddress.ip_network(network, strict=False).hosts():
+        roles[str(ip)] = rng.choices(names, weights)[0]
+    return roles
+
+def http_response(body, content_type=b"application/json"):
+    return (
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: " + content_type + b"\r\n"
+        b"Content-Length: %d\r\n"
+        b"Connection: close\r\n\r\n" % len(body)
+    ) + body
+
+def make_handler(role, slow_delay, hold_time):
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            if role == "blackhole":
+                # Accept and never answer, like a filtered or wedged service
+                await asyncio.sleep(hold_time)
+                return
+            if role == "slow":
+                await asyncio.sleep(slow_delay)
+            if role == "malformed":
+                writer.write(http_response(random.choice(MALFORMED_BODIES), b"text/html"))
+            else:
+                writer.write(http_response(SYNCING_BODY))
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def serve(roles, port, slow_delay=0.5, hold_time=30, ready=None):
+    """Start one listener per non-closed host and serve until cancelled"""
+    servers = []
+    for ip, role in roles.items():
+        if role == "closed":
+            continue
+        servers.append(await asyncio.start_server(make_handler(role, slow_delay, hold_time),
+                                                  ip, port, backlog=1024))
+    if ready is not None:
+        ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for server in servers:
+            server.close()
+
+def run_fleet(network, port, ratios, seed=0, slow_delay=0.5, hold_time=30, ready=None):
+    """Process entry point for a fleet"""
+    roles = assign_roles(network, ratios, seed)
+    try:
+        asyncio.run(serve(roles, port, slow_delay, hold_time, ready))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake fleet of eth_syncing responders on loopback")
+    parser.add_argument("--network", default="127.77.0.0/22", help="Loopback network for the fleet")
+    parser.add_argument("--port", type=int, default=18545, help="Port every responder listens on")
+    parser.add_argument("--open", type=float, default=0.05, help="Share of valid, fast responders")
+    parser.add_argument("--slow", type=float, default=0.02, help="Share of valid but slow responders")
+    parser.add_argument("--malformed", type=float, default=0.02, help="Share of non-JSON-RPC responders")
+    parser.add_argument("--blackhole", type=float, default=0.05, help="Share of hosts that never answer")
+    parser.add_argument("--closed", type=float, default=0.86, help="Share of hosts with no listener")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Reply delay of slow hosts in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for role assignment")
+    args = parser.parse_args()
+
+    ratios = {role: getattr(args, role) for role in ROLES}
+    print(f"Serving fake fleet on {args.network}:{args.port} (Ctrl+C to stop)")
+    run_fleet(args.network, args.port, ratios, args.seed, args.slow_delay)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Scanner throughput benchmark
+Starts a fake fleet on loopback, scans it and reports hosts/sec, probe latency, peak RSS and accuracy
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import contextlib
+import multiprocessing
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ethereum_node_scanner import create_scanner
+from targets import TargetSet
+from fake_fleet import ROLES, assign_roles, run_fleet
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def instrument(scanner, latencies):
+    """Record the duration of every probe the scanner makes"""
+    if hasattr(scanner, "probe_async"):
+        probe_async = scanner.probe_async
+
+        async def timed_probe_async(ip, port=8545):
+            started = time.perf_counter()
+            try:
+                return await probe_async(ip, port)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        scanner.probe_async = timed_probe_async
+    else:
+        probe = scanner.probe
+
+        def timed_probe(ip, port=8545):
+            started = time.perf_counter()
+            try:
+                return probe(ip, port)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        scanner.probe = timed_probe
+
+def run_benchmark(args):
+    ratios = {role: getattr(args, role) for role in ROLES}
+    roles = assign_roles(args.network, ratios, args.seed)
+    expected_roles = {"open"} | ({"slow"} if args.slow_delay < args.timeout else set())
+    expected = {ip for ip, role in roles.items() if role in expected_roles}
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    fleet = context.Process(target=run_fleet, name="fake-fleet", daemon=True,
+                            args=(args.network, args.port, ratios, args.seed, args.slow_delay,
+                                  args.timeout * 4, ready))
+    fleet.start()
+    try:
+        if not ready.wait(60):
+            raise RuntimeError("fake fleet did not start")
+
+        scanner = create_scanner(args.engine, args.timeout, args.threads, args.concurrency,
+                                 args.adaptive_timeout, args.min_timeout, ports=[args.port])
+        latencies = []
+        instrument(scanner, latencies)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            scanner.scan_targets(iter(TargetSet.parse([args.network])))
+        elapsed = time.perf_counter() - started
+    finally:
+        fleet.terminate()
+        fleet.join()
+
+    found = {node["ip"] for node in scanner.found_nodes}
+    missed = expected - found
+    false_positives = found - expected
+    return {
+        "engine": args.engine,
+        "network": args.network,
+        "hosts": len(roles),
+        "roles": {role: sum(1 for r in roles.values() if r == role) for role in ROLES},
+        "seconds": round(elapsed, 3),
+        "hosts_per_sec": round(len(roles) / elapsed, 1),
+        "probe_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "probe_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "expected_nodes": len(expected),
+        "found_nodes": len(found),
+        "missed": {role: sum(1 for ip in missed if roles[ip] == role) for role in expected_roles},
+        "false_positives": {role: sum(1 for ip in false_positives if roles[ip] == role)
+                            for role in ROLES if role not in expected_roles},
+        "recall": round(len(expected & found) / len(expected), 4) if expected else 1.0,
+        "precision": round(len(expected & found) / len(found), 4) if found else 1.0,
+    }
+
+def print_report(report):
+    print(f"\n{'='*50}")
+    print(f"BENCHMARK: {report['engine']} engine on {report['network']}")
+    print(f"{'='*50}")
+    print("Fleet: " + ", ".join(f"{role}={count}" for role, count in report["roles"].items()))
+    print(f"Hosts scanned:   {report['hosts']} in {report['seconds']}s")
+    print(f"Throughput:      {report['hosts_per_sec']} hosts/sec")
+    print(f"Probe latency:   p50 {report['probe_p50_ms']} ms, p99 {report['probe_p99_ms']} ms")
+    print(f"Peak RSS:        {report['peak_rss_mib']} MiB")
+    print(f"Nodes:           {report['found_nodes']} found / {report['expected_nodes']} expected")
+    print(f"Recall:          {report['recall']}  (missed: {report['missed']})")
+    print(f"Precision:       {report['precision']}  (false positives: {report['false_positives']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scanner against a fake loopback fleet")
+    parser.add_argument("--network", default="127.77.0.0/22", help="Loopback network for the fleet")
+    parser.add_argument("--port", type=int, default=18545, help="Port every responder listens on")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread", help="Scan engine")
+    parser.add_argument("--threads", type=int, default=500, help="Threads for the thread engine")
+    parser.add_argument("--concurrency", type=int, default=2000, help="Probes in flight for the async engine")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Probe timeout in seconds")
+    parser.add_argument("--adaptive-timeout", action="store_true", help="Use adaptive per-/24 timeouts")
+    parser.add_argument("--min-timeout", type=float, default=0.2, help="Floor for adaptive timeouts")
+    parser.add_argument("--open", type=float, default=0.05, help="Share of valid, fast responders")
+    parser.add_argument("--slow", type=float, default=0.02, help="Share of valid but slow responders")
+    parser.add_argument("--malformed", type=float, default=0.02, help="Share of non-JSON-RPC responders")
+    parser.add_argument("--blackhole", type=float, default=0.05, help="Share of hosts that never answer")
+    parser.add_argument("--closed", type=float, default=0.86, help="Share of hosts with no listener")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Reply delay of slow hosts in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for role assignment")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if not args.network.startswith("127."):
+        parser.error("the fake fleet only runs on loopback (127.0.0.0/8) networks")
+
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Coordinator/worker mode
+The coordinator splits the target set into shards and leases them over plain TCP to worker
+processes on this or other hosts, which scan them and stream found nodes back
+"""
+
+import os
+import hmac
+import json
+import time
+import socket
+import asyncio
+import threading
+from collections import deque
+
+from ethereum_node_scanner import EthereumNodeScanner, create_scanner, target_set
+from history_store import HistoryStore
+from metrics import MetricsServer
+from node_store import NodeStore
+from result_sink import JsonlResultSink
+from targets import chunk_intervals, iter_intervals
+
+DEFAULT_PORT = 7600
+
+# Longest JSON line either side accepts; a node carries at most one 64 KiB reply
+MESSAGE_LIMIT = 1 << 20
+
+# Seconds a worker waits before asking again when every remaining shard is leased
+WAIT_INTERVAL = 1
+
+def parse_address(value, default_port=DEFAULT_PORT):
+    """("host", port) from "host:port", "host" or ":port" """
+    host, _, port = value.rpartition(":") if ":" in value else (value, "", "")
+    return host or "127.0.0.1", int(port) if port else default_port
+
+def encode_message(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+class Lease:
+    __slots__ = ("lease_id", "shard", "conn_id", "worker", "expires")
+
+    def __init__(self, lease_id, shard, conn_id, worker, expires):
+        self.lease_id = lease_id
+        self.shard = shard
+        self.conn_id = conn_id
+        self.worker = worker
+        self.expires = expires
+
+class Coordinator:
+    """Hands out shards under expiring leases and merges what workers report into `scanner`"""
+
+    def __init__(self, scanner, shards, options, lease_time=60, token=None):
+        self.scanner = scanner
+        self.shards = shards
+        self.options = options
+        self.lease_time = lease_time
+        self.token = token
+        self.pending = deque(range(len(shards)))
+        # Only current leases; a lease that lapsed or was released is dropped from here
+        self.leases = {}
+        self.done = set()
+        self.next_lease = 1
+        self.next_conn = 1
+        self.reissued = 0
+        self.writers = set()
+        self.handlers = set()
+        self.finished = None
+
+    def reclaim(self, now):
+        """Put shards whose lease expired back at the front of the queue"""
+        for lease in [lease for lease in self.leases.values() if lease.expires < now]:
+            del self.leases[lease.lease_id]
+            self.pending.appendleft(lease.shard)
+            self.reissued += 1
+            print(f"⚠️  Lease on shard {lease.shard} held by {lease.worker} expired; shard re-queued")
+
+    def release(self, conn_id):
+        """Re-queue the shards of a worker that disconnected"""
+        for lease in [lease for lease in self.leases.values() if lease.conn_id == conn_id]:
+            del self.leases[lease.lease_id]
+            self.pending.appendleft(lease.shard)
+            self.reissued += 1
+            print(f"⚠️  {lease.worker} disconnected; shard {lease.shard} re-queued")
+
+    def grant(self, conn_id, worker):
+        """Reply to a worker asking for work"""
+        now = time.monotonic()
+        self.reclaim(now)
+        if not self.pending:
+            if len(self.done) == len(self.shards):
+                return {"type": "done"}
+            # Everything left is leased; the worker asks again in case a lease lapses
+            return {"type": "wait", "seconds": WAIT_INTERVAL}
+        shard = self.pending.popleft()
+        lease = Lease(self.next_lease, shard, conn_id, worker, now + self.lease_time)
+        self.next_lease += 1
+        self.leases[lease.lease_id] = lease
+        return {"type": "shard", "lease": lease.lease_id, "shard": shard, "intervals": self.shards[shard]}
+
+    def renew(self, lease_id):
+        lease = self.leases.get(lease_id)
+        if lease is not None:
+            lease.expires = time.monotonic() + self.lease_time
+
+    def complete(self, lease_id, shard, worker):
+        """Mark a shard done; the lease says which shard, the worker's word is used only once it lapsed"""
+        lease = self.leases.pop(lease_id, None)
+        if lease is not None:
+            shard = lease.shard
+        elif type(shard) is not int or not 0 <= shard < len(self.shards):
+            print(f"⚠️  Ignoring completion of unknown shard {shard!r} from {worker}")
+            return
+        if shard in self.done:
+            return
+        if lease is None:
+            # A lapsed lease still finished the work; drop the copy that was queued or leased again
+            if shard in self.pending:
+                self.pending.remove(shard)
+            for lease in [lease for lease in self.leases.values() if lease.shard == shard]:
+                del self.leases[lease.lease_id]
+        self.done.add(shard)
+        print(f"Shard {shard} done by {worker} ({len(self.done)}/{len(self.shards)}, "
+              f"{len(self.scanner.found_nodes)} node(s) so far)")
+        if len(self.done) == len(self.shards):
+            self.finished.set()
+
+    async def handle(self, reader, writer):
+        conn_id = self.next_conn
+        self.next_conn += 1
+        worker = f"worker #{conn_id}"
+        self.writers.add(writer)
+        self.handlers.add(asyncio.current_task())
+
+        async def send(message):
+            writer.write(encode_message(message))
+            await writer.drain()
+
+        try:
+            hello = json.loads(await reader.readline() or b"null")
+            if not isinstance(hello, dict) or hello.get("type") != "hello":
+                return
+            if self.token and not hmac.compare_digest(str(hello.get("token") or ""), self.token):
+                await send({"type": "error", "error": "wrong token"})
+                return
+            worker = f"{hello.get('worker', 'worker')} #{conn_id}"
+            print(f"🔗 {worker} connected from {writer.get_extra_info('peername')[0]}")
+            await send({"type": "welcome", "options": self.options, "lease_time": self.lease_time})
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    raise ValueError("message is not a JSON object")
+                kind = message.get("type")
+                if kind == "node":
+                    self.scanner.record_node(message["node"])
+                elif kind == "progress":
+                    self.renew(message["lease"])
+                    self.scanner.metrics.remote[worker] = message["metrics"]
+                elif kind == "complete":
+                    self.scanner.metrics.remote[worker] = message["metrics"]
+                    self.complete(message["lease"], message["shard"], worker)
+                elif kind == "lease":
+                    await send(self.grant(conn_id, worker))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, asyncio.LimitOverrunError) as e:
+            print(f"⚠️  Dropping {worker}: {e}")
+        finally:
+            self.release(conn_id)
+            self.writers.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def serve(self, host, port, grace=5):
+        """Run until every shard is done"""
+        self.finished = asyncio.Event()
+        if not self.shards:
+            self.finished.set()
+        server = await asyncio.start_server(self.handle, host, port, limit=MESSAGE_LIMIT)
+        try:
+            await self.finished.wait()
+            # Let connected workers collect their "done" before the sockets close
+            deadline = time.monotonic() + grace
+            while self.writers and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        finally:
+            server.close()
+            # Workers still connected (e.g. stopped ones) are cut off; their handlers then read EOF
+            handlers = list(self.handlers)
+            for writer in list(self.writers):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+    def merge_stats(self):
+        """Fold the last snapshot of every worker into the scanner's outcome totals"""
+        controller = self.scanner.controller
+        for snapshot in self.scanner.metrics.remote.values():
+            for name, count in snapshot.pop("outcomes", {}).items():
+                controller.record(name, count)
+            for name, count in snapshot.pop("local_errors", {}).items():
+                controller.local_errors[name] = controller.local_errors.get(name, 0) + count
+            snapshot.update(inflight=0, limit=0)
+
+def coordinator_command(args):
+    try:
+        targets = target_set(args)
+    except (ValueError, OSError) as e:
+        raise SystemExit(f"error: {e}")
+    host, port = parse_address(args.listen)
+    shards = [[list(interval) for interval in chunk]
+              for chunk in chunk_intervals(targets.intervals, args.shard_size)]
+
+    scanner = EthereumNodeScanner(timeout=args.timeout, ports=args.ports)
+    scanner.excludes = targets.excludes
+    scanner.metrics.target_hosts = len(targets)
+    scanner.sink = JsonlResultSink(args.stream_file)
+    # Settings that decide what counts as a node; threads, concurrency and rate stay per worker
+    options = {
+        "engine": args.engine,
+        "timeout": args.timeout,
+        "adaptive_timeout": args.adaptive_timeout,
+        "min_timeout": args.min_timeout,
+        "fingerprint": args.fingerprint,
+        "ports": args.ports,
+    }
+    coordinator = Coordinator(scanner, shards, options, lease_time=args.lease, token=args.token)
+
+    print("Ethereum Node Scanner - coordinator")
+    print("=" * 50)
+    print(f"Listening on {host}:{port}")
+    print(f"{len(targets)} addresses in {len(shards)} shard(s) of up to {args.shard_size}, "
+          f"lease {args.lease:g}s")
+    print(f"Port(s) {', '.join(map(str, args.ports))}, timeout {args.timeout}s, engine {args.engine}")
+    if targets.excludes:
+        print(f"Excluded: {len(targets.excludes)} range(s), never probed")
+    print(f"Streaming results to: {args.stream_file}")
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(lambda: scanner.metrics.render(scanner.controller, len(scanner.found_nodes)),
+                                       args.metrics_port, args.metrics_host).start()
+        print(f"Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
+    print()
+
+    start_time = time.time()
+    try:
+        asyncio.run(coordinator.serve(host, port))
+    except KeyboardInterrupt:
+        print("\nScan interrupted, writing out results found so far...")
+    end_time = time.time()
+    completed = len(coordinator.done) == len(shards)
+    if metrics_server is not None:
+        metrics_server.close()
+    scanner.sink.close()
+    coordinator.merge_stats()
+
+    scanner.print_summary()
+    print(f"Shards done: {len(coordinator.done)}/{len(shards)}, re-issued: {coordinator.reissued}")
+    if scanner.found_nodes:
+        filename = scanner.save_results(args.output)
+        print(f"\nDetailed results saved to: {filename}")
+    if args.history_db:
+        history = HistoryStore(args.history_db)
+        scan_id = history.record_scan(scanner.found_nodes, start_time, end_time, completed,
+                                      source="coordinator")
+        history.close()
+        print(f"History: scan #{scan_id} recorded in {args.history_db}")
+    print(f"\nScan completed in {end_time - start_time:.2f} seconds")
+
+class CoordinatorLink:
+    """Blocking JSON Lines connection from a worker to the coordinator, shared by scan threads"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        data = encode_message(message)
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("connection to the coordinator is closed")
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.closed = True
+                raise
+
+    def receive(self):
+        line = self.reader.readline(MESSAGE_LIMIT)
+        if not line:
+            self.closed = True
+            raise ConnectionError("coordinator closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.closed = True
+        self.reader.close()
+        self.sock.close()
+
+class LinkSink:
+    """Result sink that streams nodes to the coordinator"""
+
+    def __init__(self, link):
+        self.link = link
+
+    def write(self, node_info):
+        try:
+            self.link.send({"type": "node", "node": node_info})
+        except OSError:
+            # The shard stops early and its lease lapses; the coordinator re-issues it
+            pass
+
+    def close(self):
+        pass
+
+def connect_coordinator(host, port, wait=30):
+    """Connect, retrying for up to `wait` seconds so workers can start before the coordinator"""
+    deadline = time.monotonic() + wait
+    announced = False
+    while True:
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+            break
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            if not announced:
+                print(f"Waiting for coordinator at {host}:{port}...")
+                announced = True
+            time.sleep(1)
+    sock.settimeout(None)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def worker_command(args):
+    host, port = parse_address(args.coordinator)
+    name = args.name or f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        link = CoordinatorLink(connect_coordinator(host, port, args.connect_wait))
+        link.send({"type": "hello", "worker": name, "token": args.token})
+        welcome = link.receive()
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"❌ Cannot reach coordinator at {host}:{port}: {e}")
+    if welcome.get("type") != "welcome":
+        link.close()
+        raise SystemExit(f"❌ Coordinator refused this worker: {welcome.get('error', welcome)}")
+
+    options = welcome["options"]
+    scanner = create_scanner(options["engine"], options["timeout"], args.threads, args.concurrency,
+                             options["adaptive_timeout"], options["min_timeout"], options["fingerprint"],
+                             options["ports"], args.rate)
+    scanner.sink = LinkSink(link)
+    print(f"Worker {name} connected to {host}:{port}")
+    print(f"Port(s) {', '.join(map(str, options['ports']))}, timeout {options['timeout']}s, "
+          f"engine {options['engine']}, concurrency: {scanner.controller.describe()}")
+
+    current = {"lease": None}
+    stop = threading.Event()
+
+    def heartbeat():
+        # Renews the lease while the shard is scanned and carries live metrics
+        while not stop.wait(welcome["lease_time"] / 3):
+            if current["lease"] is None:
+                continue
+            try:
+                link.send({"type": "progress", "lease": current["lease"],
+                           "metrics": scanner.metrics.snapshot(scanner.controller)})
+            except OSError:
+                return
+
+    def addresses(intervals):
+        for ip_int in iter_intervals(intervals):
+            if link.closed:
+                return
+            yield ip_int
+
+    threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True).start()
+    shards = nodes = 0
+    try:
+        while True:
+            link.send({"type": "lease"})
+            reply = link.receive()
+            if reply["type"] == "done":
+                print("All shards are done")
+                break
+            if reply["type"] == "wait":
+                time.sleep(reply["seconds"])
+                continue
+            intervals = [tuple(interval) for interval in reply["intervals"]]
+            size = sum(last - first + 1 for first, last in intervals)
+            print(f"Scanning shard {reply['shard']}: {size} addresses")
+            current["lease"] = reply["lease"]
+            # Shards never overlap, so only this shard's nodes are needed for dedup
+            scanner.found_nodes = NodeStore()
+            scanner.scan_targets(addresses(intervals))
+            if link.closed:
+                raise ConnectionError("connection to the coordinator was lost")
+            current["lease"] = None
+            link.send({"type": "complete", "lease": reply["lease"], "shard": reply["shard"],
+                       "metrics": scanner.metrics.snapshot(scanner.controller)})
+            shards += 1
+            nodes += len(scanner.found_nodes)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}; unfinished shards go back to other workers")
+    except KeyboardInterrupt:
+        print("\n👋 Worker stopped")
+    finally:
+        stop.set()
+        link.close()
+    print(f"Worker {name}: {shards} shard(s) scanned, {nodes} node(s) reported")
+
+def add_cluster_commands(subparsers):
+    """Register the `coordinator` and `worker` subcommands on an argparse subparsers object"""
+    coordinator = subparsers.add_parser(
+        "coordinator", help="Lease shards of the target set to workers and collect their results")
+    coordinator.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}",
+                             help="HOST:PORT workers connect to (0.0.0.0 to accept other hosts)")
+    coordinator.add_argument("--shard-size", type=int, default=65536, help="Addresses per shard")
+    coordinator.add_argument("--lease", type=float, default=60,
+                             help="Seconds a shard stays leased without a heartbeat before it is re-issued")
+    coordinator.add_argument("--token", help="Shared secret workers must present")
+    coordinator.set_defaults(func=coordinator_command)
+
+    worker = subparsers.add_parser("worker", help="Scan shards leased from a coordinator")
+    worker.add_argument("--coordinator", default=f"127.0.0.1:{DEFAULT_PORT}", help="Coordinator HOST:PORT")
+    worker.add_argument("--name", help="Worker name shown by the coordinator (default: hostname-pid)")
+    worker.add_argument("--token", help="Shared secret of the coordinator")
+    worker.add_argument("--connect-wait", type=float, default=30,
+                        help="Seconds to keep retrying while the coordinator is not up yet")
+    worker.set_defaults(func=worker_command)
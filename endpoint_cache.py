@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Known-endpoint cache for incremental rescans
+Remembers responsive (ip, port) pairs and swept address blocks, each with a last-seen time and TTL
+"""
+
+import os
+import json
+import time
+import socket
+
+def int_to_ip(ip_int):
+    """Convert an integer to a dotted IPv4 string"""
+    return socket.inet_ntoa(ip_int.to_bytes(4, "big"))
+
+def endpoint_key(ip, port):
+    return f"{ip}:{port}"
+
+def range_key(first, last):
+    return f"{int_to_ip(first)}-{int_to_ip(last)}"
+
+def split_intervals(intervals, prefixlen=16):
+    """Cut integer intervals at /prefixlen boundaries so TTLs track blocks of that size"""
+    step = 1 << (32 - prefixlen)
+    blocks = []
+    for first, last in intervals:
+        start = first
+        while start <= last:
+            end = min(last, (start // step + 1) * step - 1)
+            blocks.append((start, end))
+            start = end + 1
+    return blocks
+
+def sync_state(node_info):
+    """Summarize an eth_syncing reply as "synced", "syncing" or "unknown" """
+    result = node_info.get("response", {}).get("result")
+    if result is False:
+        return "synced"
+    if result:
+        return "syncing"
+    return "unknown"
+
+class EndpointCache:
+    def __init__(self, filename="ethereum_endpoints_cache.json", endpoint_ttl=7 * 86400,
+                 range_ttl=6 * 3600, dead_range_ttl=24 * 3600):
+        self.filename = filename
+        self.endpoint_ttl = endpoint_ttl
+        self.range_ttl = range_ttl
+        self.dead_range_ttl = dead_range_ttl
+        self.endpoints = {}
+        self.ranges = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            self.endpoints = data.get("endpoints", {})
+            self.ranges = data.get("ranges", {})
+
+    def known_endpoints(self):
+        """(ip, port) pairs of every cached endpoint"""
+        return [(entry["ip"], entry["port"]) for entry in self.endpoints.values()]
+
+    def endpoints_within(self, intervals):
+        """Keys of cached endpoints whose address lies inside the intervals"""
+        keys = []
+        for key, entry in self.endpoints.items():
+            ip_int = int.from_bytes(socket.inet_aton(entry["ip"]), "big")
+            if any(first <= ip_int <= last for first, last in intervals):
+                keys.append(key)
+        return keys
+
+    def stale_blocks(self, intervals, now=None):
+        """Blocks of the target intervals that were never swept or whose TTL expired"""
+        now = now or time.time()
+        stale = []
+        for first, last in split_intervals(intervals):
+            entry = self.ranges.get(range_key(first, last))
+            if entry is None or entry["last_swept"] + entry["ttl"] <= now:
+                stale.append((first, last))
+        return stale
+
+    def diff(self, found_nodes, verified=None):
+        """Compare this run's nodes with the cache: new, gone and changed sync status
+
+        Only endpoints in `verified` (all cached ones by default) can be reported gone. Transitions
+        are reported once: an endpoint already marked gone is not gone again, and counts as new
+        when it answers again.
+        """
+        found = {endpoint_key(node["ip"], node["port"]): node for node in found_nodes}
+        verified = self.endpoints.keys() if verified is None else verified
+        new, gone, changed = [], [], []
+        for key, node in found.items():
+            entry = self.endpoints.get(key)
+            if entry is None or entry.get("gone"):
+                new.append(node)
+            elif entry["sync"] != sync_state(node):
+                changed.append({"ip": node["ip"], "port": node["port"],
+                                "before": entry["sync"], "after": sync_state(node)})
+        for key in verified:
+            entry = self.endpoints.get(key)
+            if entry is not None and not entry.get("gone") and key not in found:
+                gone.append({"ip": entry["ip"], "port": entry["port"], "last_seen": entry["last_seen"]})
+        return {"new": new, "gone": gone, "changed": changed}
+
+    def update(self, found_nodes, swept_blocks, verified=(), now=None):
+        """Record this run's nodes and swept blocks, and drop endpoints past their TTL
+
+        Endpoints in `verified` that did not answer are marked gone; they stay cached, and are
+        re-verified, until their TTL since last seen runs out.
+        """
+        now = now or time.time()
+        hits = {}
+        found = set()
+        for node in found_nodes:
+            key = endpoint_key(node["ip"], node["port"])
+            found.add(key)
+            self.endpoints[key] = {
+                "ip": node["ip"],
+                "port": node["port"],
+                "sync": sync_state(node),
+                "last_seen": now,
+                "last_verified": now,
+                "gone": False,
+                "ttl": self.endpoint_ttl,
+            }
+            ip_int = int.from_bytes(socket.inet_aton(node["ip"]), "big")
+            hits[ip_int >> 16] = hits.get(ip_int >> 16, 0) + 1
+
+        for key in verified:
+            entry = self.endpoints.get(key)
+            if entry is not None and key not in found:
+                entry["gone"] = True
+                entry["last_verified"] = now
+
+        for key, entry in list(self.endpoints.items()):
+            if entry["last_seen"] + entry["ttl"] <= now:
+                del self.endpoints[key]
+
+        for first, last in swept_blocks:
+            count = hits.get(first >> 16, 0)
+            self.ranges[range_key(first, last)] = {
+                "last_swept": now,
+                "hits": count,
+                # Blocks with no endpoints change least, so they are re-swept least often
+                "ttl": self.range_ttl if count else self.dead_range_ttl,
+            }
+
+    def save(self):
+        """Write the cache atomically"""
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"endpoints": self.endpoints, "ranges": self.ranges}, f)
+        os.replace(tmp, self.filename)
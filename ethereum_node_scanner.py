@@ -5,324 +5,862 @@ Scans for Ethereum nodes running on port 8545 that respond to eth_syncing JSON-R
 """
 
 import socket
+import errno
+import selectors
 import json
-import requests
+import asyncio
 import threading
 import time
-import ipaddress
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import argparse
 import sys
+import os
+import queue
+import multiprocessing
+
+from result_sink import JsonlResultSink, read_jsonl
+from scan_state import ScanState, ip_to_int, network_interval, range_interval
+from adaptive_timeout import RttTracker
+from endpoint_cache import EndpointCache, int_to_ip, split_intervals
+from rate_control import ConcurrencyController, LocalResourceError, classify_errno
+from metrics import ScanMetrics, MetricsServer
+from node_store import NodeStore
+from targets import TargetSet, iter_intervals
+from history_store import HistoryStore, add_history_commands
+
+# Attempts per host when the scan host itself runs out of sockets or ports
+LOCAL_RETRIES = 5
+
+# Largest reply read from a probed host; real eth_syncing and fingerprint replies are well under 1 KiB
+MAX_RESPONSE_BYTES = 64 * 1024
+
+# Seconds between metric snapshots sent from shard processes to the parent
+METRICS_INTERVAL = 2
+
+ETH_SYNCING_PAYLOAD = json.dumps({
+    "jsonrpc": "2.0",
+    "method": "eth_syncing",
+    "params": [],
+    "id": 1
+}).encode()
+
+# Methods sent in one batch when fingerprinting; ids are 1-based positions
+FINGERPRINT_METHODS = ["eth_syncing", "eth_chainId", "net_version", "web3_clientVersion", "eth_blockNumber"]
+
+FINGERPRINT_PAYLOAD = json.dumps([
+    {"jsonrpc": "2.0", "method": method, "params": [], "id": i}
+    for i, method in enumerate(FINGERPRINT_METHODS, 1)
+]).encode()
+
+def build_request_tail(payload, connection=b"close"):
+    """Serialize everything in a JSON-RPC POST that follows the Host header value"""
+    return (
+        b"\r\nContent-Type: application/json\r\n"
+        b"Content-Length: %d\r\n"
+        b"Connection: %s\r\n\r\n" % (len(payload), connection)
+    ) + payload
+
+# Pre-serialized request; only the Host value differs between probes
+ETH_SYNCING_REQUEST_TAIL = build_request_tail(ETH_SYNCING_PAYLOAD)
+FINGERPRINT_REQUEST_TAIL = build_request_tail(FINGERPRINT_PAYLOAD)
+
+def build_rpc_request(ip, port, tail=ETH_SYNCING_REQUEST_TAIL):
+    """Build a raw HTTP/1.1 POST carrying a JSON-RPC payload"""
+    return b"POST / HTTP/1.1\r\nHost: %s:%d%s" % (ip.encode(), port, tail)
+
+def response_complete(raw):
+    """Return True once raw holds a whole HTTP response"""
+    head, sep, body = raw.partition(b"\r\n\r\n")
+    if not sep:
+        return False
+    head = head.lower()
+    if b"transfer-encoding: chunked" in head:
+        return body.endswith(b"0\r\n\r\n")
+    start = head.find(b"content-length:")
+    if start < 0:
+        # No length given, the body ends when the server closes
+        return False
+    try:
+        length = int(head[start + 15:].split(b"\r\n", 1)[0])
+    except ValueError:
+        return False
+    return len(body) >= length
+
+def response_state(raw, limit=MAX_RESPONSE_BYTES):
+    """Classify a partly read response: "complete", "reject" or None to keep reading
+
+    Replies that are not HTTP 200, whose body does not start like JSON, or that would exceed
+    `limit` bytes are rejected as soon as the bytes showing it arrive.
+    """
+    head, sep, body = raw.partition(b"\r\n\r\n")
+    if not sep:
+        if len(raw) > limit or (len(raw) >= 5 and not raw.startswith(b"HTTP/")):
+            return "reject"
+        return None
+    if len(raw) > limit or head[9:12] != b"200":
+        return "reject"
+    head = head.lower()
+    chunked = b"transfer-encoding: chunked" in head
+    # Skip the first chunk-size line to reach the JSON of a chunked body
+    data = (body.partition(b"\r\n")[2] if chunked else body).lstrip()
+    if data and data[:1] not in (b"{", b"["):
+        return "reject"
+    start = head.find(b"content-length:")
+    if not chunked and start >= 0:
+        try:
+            if int(head[start + 15:].split(b"\r\n", 1)[0]) > limit:
+                return "reject"
+        except ValueError:
+            return "reject"
+    return "complete" if response_complete(raw) else None
+
+def recv_http_response(sock, deadline=None, limit=MAX_RESPONSE_BYTES):
+    """Read a whole HTTP response from a blocking socket by a monotonic deadline
+
+    Returns b"" for rejected replies; raises socket.timeout when the deadline passes.
+    """
+    raw = bytearray()
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("response deadline passed")
+            # A slow trickle cannot stretch a probe past its deadline
+            sock.settimeout(remaining)
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        raw += chunk
+        state = response_state(raw, limit)
+        if state == "reject":
+            return b""
+        if state == "complete":
+            break
+    return bytes(raw)
+
+async def read_http_response(reader, limit=MAX_RESPONSE_BYTES):
+    """Read a whole HTTP response from an asyncio stream; callers bound it with a deadline
+
+    Returns b"" for rejected replies.
+    """
+    raw = bytearray()
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk:
+            break
+        raw += chunk
+        state = response_state(raw, limit)
+        if state == "reject":
+            return b""
+        if state == "complete":
+            break
+    return bytes(raw)
+
+def decode_chunked(body):
+    """Decode a chunked transfer-encoded HTTP body"""
+    decoded = b""
+    while body:
+        size_line, _, rest = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            break
+        decoded += rest[:size]
+        body = rest[size + 2:]
+    return decoded
+
+def parse_http_json(raw):
+    """Parse a raw HTTP 200 JSON-RPC response and return its decoded JSON body, or None"""
+    head, sep, body = raw.partition(b"\r\n\r\n")
+    if not sep or b'"jsonrpc"' not in body:
+        # Cheap check before decoding: every JSON-RPC reply names its version
+        return None
+    lines = head.split(b"\r\n")
+    status = lines[0].split(b" ", 2)
+    if len(status) < 2 or status[1] != b"200":
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip().lower()
+    try:
+        if headers.get(b"transfer-encoding") == b"chunked":
+            body = decode_chunked(body)
+        elif b"content-length" in headers:
+            body = body[:int(headers[b"content-length"])]
+        return json.loads(body)
+    except (ValueError, RecursionError):
+        # RecursionError: a small body nested thousands of levels deep
+        return None
+
+def is_rpc_reply(data):
+    """Check if decoded JSON is a valid JSON-RPC response"""
+    return isinstance(data, dict) and "jsonrpc" in data and "id" in data
+
+def index_replies(data):
+    """Replies of a decoded batch keyed by id; replies whose id is not an integer are ignored"""
+    return {reply["id"]: reply for reply in data
+            if is_rpc_reply(reply) and type(reply["id"]) is int}
+
+def parse_rpc_response(raw):
+    """Parse a raw HTTP response and return the JSON-RPC reply, or None"""
+    data = parse_http_json(raw)
+    if is_rpc_reply(data):
+        return data
+    return None
+
+def parse_hex_quantity(value):
+    """Decode a JSON-RPC hex quantity such as "0x1", or None"""
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+def parse_fingerprint_response(raw):
+    """Parse the reply to the fingerprint batch
+
+    Returns the eth_syncing reply and a dict of fingerprint fields, or None.
+    Servers that reject batches still count as nodes, with empty fields.
+    """
+    data = parse_http_json(raw)
+    if is_rpc_reply(data):
+        return data, {}
+    if not isinstance(data, list):
+        return None
+    replies = index_replies(data)
+    syncing = replies.get(1)
+    if syncing is None:
+        return None
+    results = {method: replies.get(i, {}).get("result")
+               for i, method in enumerate(FINGERPRINT_METHODS, 1)}
+    network_id = results["net_version"]
+    client_version = results["web3_clientVersion"]
+    return syncing, {
+        "chain_id": parse_hex_quantity(results["eth_chainId"]),
+        "network_id": network_id if isinstance(network_id, str) else None,
+        "client_version": client_version if isinstance(client_version, str) else None,
+        "block_number": parse_hex_quantity(results["eth_blockNumber"]),
+    }
+
+def parse_ports(value):
+    """Parse a comma-separated port list such as "8545,8546" """
+    try:
+        ports = sorted({int(port) for port in value.split(",") if port.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port list: {value}")
+    if not ports or not all(0 < port < 65536 for port in ports):
+        raise argparse.ArgumentTypeError(f"invalid port list: {value}")
+    return ports
+
+COMMON_RANGES = [
+    "192.168.0.0/16",    # Class C private
+    "10.0.0.0/8",        # Class A private
+    "172.16.0.0/12",     # Class B private
+    "127.0.0.0/8",       # Loopback
+]
+
+# Major Asia IP ranges (using /16 instead of /8 to avoid huge scans)
+ASIA_RANGES = [
+    "1.1.0.0/16",        # APNIC - Asia Pacific
+    "1.2.0.0/16",        # APNIC - Asia Pacific
+    "1.3.0.0/16",        # APNIC - Asia Pacific
+    "14.0.0.0/16",       # APNIC - Asia Pacific
+    "14.1.0.0/16",       # APNIC - Asia Pacific
+    "27.0.0.0/16",       # APNIC - Asia Pacific
+    "27.1.0.0/16",       # APNIC - Asia Pacific
+    "36.0.0.0/16",       # APNIC - Asia Pacific
+    "36.1.0.0/16",       # APNIC - Asia Pacific
+    "39.0.0.0/16",       # APNIC - Asia Pacific
+    "42.0.0.0/16",       # APNIC - Asia Pacific
+    "49.0.0.0/16",       # APNIC - Asia Pacific
+    "58.0.0.0/16",       # APNIC - Asia Pacific
+    "58.1.0.0/16",       # APNIC - Asia Pacific
+    "59.0.0.0/16",       # APNIC - Asia Pacific
+    "60.0.0.0/16",       # APNIC - Asia Pacific
+    "60.1.0.0/16",       # APNIC - Asia Pacific
+    "61.0.0.0/16",       # APNIC - Asia Pacific
+    "61.1.0.0/16",       # APNIC - Asia Pacific
+    "101.0.0.0/16",      # APNIC - Asia Pacific
+    "101.1.0.0/16",      # APNIC - Asia Pacific
+    "103.0.0.0/16",      # APNIC - Asia Pacific
+    "103.1.0.0/16",      # APNIC - Asia Pacific
+    "106.0.0.0/16",      # APNIC - Asia Pacific
+    "110.0.0.0/16",      # APNIC - Asia Pacific
+    "110.1.0.0/16",      # APNIC - Asia Pacific
+    "111.0.0.0/16",      # APNIC - Asia Pacific
+    "112.0.0.0/16",      # APNIC - Asia Pacific
+    "113.0.0.0/16",      # APNIC - Asia Pacific
+    "114.0.0.0/16",      # APNIC - Asia Pacific
+    "115.0.0.0/16",      # APNIC - Asia Pacific
+    "116.0.0.0/16",      # APNIC - Asia Pacific
+    "117.0.0.0/16",      # APNIC - Asia Pacific
+    "118.0.0.0/16",      # APNIC - Asia Pacific
+    "119.0.0.0/16",      # APNIC - Asia Pacific
+    "120.0.0.0/16",      # APNIC - Asia Pacific
+    "121.0.0.0/16",      # APNIC - Asia Pacific
+    "122.0.0.0/16",      # APNIC - Asia Pacific
+    "123.0.0.0/16",      # APNIC - Asia Pacific
+    "124.0.0.0/16",      # APNIC - Asia Pacific
+    "125.0.0.0/16",      # APNIC - Asia Pacific
+    "126.0.0.0/16",      # APNIC - Asia Pacific
+    "175.0.0.0/16",      # APNIC - Asia Pacific
+    "180.0.0.0/16",      # APNIC - Asia Pacific
+    "182.0.0.0/16",      # APNIC - Asia Pacific
+    "183.0.0.0/16",      # APNIC - Asia Pacific
+    "202.0.0.0/16",      # APNIC - Asia Pacific
+    "202.1.0.0/16",      # APNIC - Asia Pacific
+    "203.0.0.0/16",      # APNIC - Asia Pacific
+    "210.0.0.0/16",      # APNIC - Asia Pacific
+    "210.1.0.0/16",      # APNIC - Asia Pacific
+    "211.0.0.0/16",      # APNIC - Asia Pacific
+    "218.0.0.0/16",      # APNIC - Asia Pacific
+    "218.1.0.0/16",      # APNIC - Asia Pacific
+    "219.0.0.0/16",      # APNIC - Asia Pacific
+    "220.0.0.0/16",      # APNIC - Asia Pacific
+    "221.0.0.0/16",      # APNIC - Asia Pacific
+    "222.0.0.0/16",      # APNIC - Asia Pacific
+    "223.0.0.0/16",      # APNIC - Asia Pacific
+]
+
+# Major Europe IP ranges (using /16 instead of /8 to avoid huge scans)
+EUROPE_RANGES = [
+    "2.0.0.0/16",        # RIPE NCC - Europe
+    "2.1.0.0/16",        # RIPE NCC - Europe
+    "5.0.0.0/16",        # RIPE NCC - Europe
+    "5.1.0.0/16",        # RIPE NCC - Europe
+    "31.0.0.0/16",       # RIPE NCC - Europe
+    "31.1.0.0/16",       # RIPE NCC - Europe
+    "37.0.0.0/16",       # RIPE NCC - Europe
+    "46.0.0.0/16",       # RIPE NCC - Europe
+    "46.1.0.0/16",       # RIPE NCC - Europe
+    "51.0.0.0/16",       # RIPE NCC - Europe
+    "51.1.0.0/16",       # RIPE NCC - Europe
+    "62.0.0.0/16",       # RIPE NCC - Europe
+    "77.0.0.0/16",       # RIPE NCC - Europe
+    "77.1.0.0/16",       # RIPE NCC - Europe
+    "78.0.0.0/16",       # RIPE NCC - Europe
+    "79.0.0.0/16",       # RIPE NCC - Europe
+    "80.0.0.0/16",       # RIPE NCC - Europe
+    "80.1.0.0/16",       # RIPE NCC - Europe
+    "81.0.0.0/16",       # RIPE NCC - Europe
+    "82.0.0.0/16",       # RIPE NCC - Europe
+    "83.0.0.0/16",       # RIPE NCC - Europe
+    "84.0.0.0/16",       # RIPE NCC - Europe
+    "85.0.0.0/16",       # RIPE NCC - Europe
+    "86.0.0.0/16",       # RIPE NCC - Europe
+    "87.0.0.0/16",       # RIPE NCC - Europe
+    "88.0.0.0/16",       # RIPE NCC - Europe
+    "89.0.0.0/16",       # RIPE NCC - Europe
+    "90.0.0.0/16",       # RIPE NCC - Europe
+    "91.0.0.0/16",       # RIPE NCC - Europe
+    "92.0.0.0/16",       # RIPE NCC - Europe
+    "93.0.0.0/16",       # RIPE NCC - Europe
+    "94.0.0.0/16",       # RIPE NCC - Europe
+    "95.0.0.0/16",       # RIPE NCC - Europe
+    "109.0.0.0/16",      # RIPE NCC - Europe
+    "128.0.0.0/16",      # RIPE NCC - Europe
+    "128.1.0.0/16",      # RIPE NCC - Europe
+    "129.0.0.0/16",      # RIPE NCC - Europe
+    "130.0.0.0/16",      # RIPE NCC - Europe
+    "131.0.0.0/16",      # RIPE NCC - Europe
+    "132.0.0.0/16",      # RIPE NCC - Europe
+    "133.0.0.0/16",      # RIPE NCC - Europe
+    "134.0.0.0/16",      # RIPE NCC - Europe
+    "135.0.0.0/16",      # RIPE NCC - Europe
+    "136.0.0.0/16",      # RIPE NCC - Europe
+    "137.0.0.0/16",      # RIPE NCC - Europe
+    "137.1.0.0/16",      # RIPE NCC - Europe
+    "138.0.0.0/16",      # RIPE NCC - Europe
+    "139.0.0.0/16",      # RIPE NCC - Europe
+    "140.0.0.0/16",      # RIPE NCC - Europe
+    "141.0.0.0/16",      # RIPE NCC - Europe
+    "142.0.0.0/16",      # RIPE NCC - Europe
+    "143.0.0.0/16",      # RIPE NCC - Europe
+    "144.0.0.0/16",      # RIPE NCC - Europe
+    "145.0.0.0/16",      # RIPE NCC - Europe
+    "146.0.0.0/16",      # RIPE NCC - Europe
+    "147.0.0.0/16",      # RIPE NCC - Europe
+    "148.0.0.0/16",      # RIPE NCC - Europe
+    "149.0.0.0/16",      # RIPE NCC - Europe
+    "150.0.0.0/16",      # RIPE NCC - Europe
+    "151.0.0.0/16",      # RIPE NCC - Europe
+    "152.0.0.0/16",      # RIPE NCC - Europe
+    "153.0.0.0/16",      # RIPE NCC - Europe
+    "154.0.0.0/16",      # RIPE NCC - Europe
+    "155.0.0.0/16",      # RIPE NCC - Europe
+    "156.0.0.0/16",      # RIPE NCC - Europe
+    "157.0.0.0/16",      # RIPE NCC - Europe
+    "158.0.0.0/16",      # RIPE NCC - Europe
+    "159.0.0.0/16",      # RIPE NCC - Europe
+    "160.0.0.0/16",      # RIPE NCC - Europe
+    "161.0.0.0/16",      # RIPE NCC - Europe
+    "162.0.0.0/16",      # RIPE NCC - Europe
+    "163.0.0.0/16",      # RIPE NCC - Europe
+    "164.0.0.0/16",      # RIPE NCC - Europe
+    "165.0.0.0/16",      # RIPE NCC - Europe
+    "166.0.0.0/16",      # RIPE NCC - Europe
+    "167.0.0.0/16",      # RIPE NCC - Europe
+    "168.0.0.0/16",      # RIPE NCC - Europe
+    "169.0.0.0/16",      # RIPE NCC - Europe
+    "170.0.0.0/16",      # RIPE NCC - Europe
+    "171.0.0.0/16",      # RIPE NCC - Europe
+    "172.0.0.0/16",      # RIPE NCC - Europe
+    "173.0.0.0/16",      # RIPE NCC - Europe
+    "174.0.0.0/16",      # RIPE NCC - Europe
+    "176.0.0.0/16",      # RIPE NCC - Europe
+    "177.0.0.0/16",      # RIPE NCC - Europe
+    "178.0.0.0/16",      # RIPE NCC - Europe
+    "179.0.0.0/16",      # RIPE NCC - Europe
+    "181.0.0.0/16",      # RIPE NCC - Europe
+    "185.0.0.0/16",      # RIPE NCC - Europe
+    "188.0.0.0/16",      # RIPE NCC - Europe
+    "193.0.0.0/16",      # RIPE NCC - Europe
+    "193.1.0.0/16",      # RIPE NCC - Europe
+    "194.0.0.0/16",      # RIPE NCC - Europe
+    "195.0.0.0/16",      # RIPE NCC - Europe
+    "212.0.0.0/16",      # RIPE NCC - Europe
+    "212.1.0.0/16",      # RIPE NCC - Europe
+    "213.0.0.0/16",      # RIPE NCC - Europe
+]
+
+class QueueSink:
+    """Result sink that forwards nodes from a shard process to the parent"""
+    
+    def __init__(self, results):
+        self.results = results
+    
+    def write(self, node_info):
+        self.results.put(("node", node_info))
+    
+    def close(self):
+        pass
+
+def create_scanner(engine="thread", timeout=3, max_threads=1000, concurrency=10000,
+                   adaptive_timeout=False, min_timeout=0.2, fingerprint=False, ports=None,
+                   rate=None, share=1):
+    """Build a scanner for the requested engine"""
+    if engine == "async":
+        scanner = AsyncEthereumNodeScanner(timeout=timeout, max_threads=max_threads,
+                                           concurrency=concurrency, ports=ports)
+    else:
+        scanner = EthereumNodeScanner(timeout=timeout, max_threads=max_threads, ports=ports)
+    if adaptive_timeout:
+        # --timeout is the ceiling; measured RTTs can only shorten it
+        scanner.enable_adaptive_timeouts(min_timeout, timeout)
+    scanner.fingerprint = fingerprint
+    if rate or share > 1:
+        # Processes on one host split the packet rate and the ephemeral port range
+        scanner.controller = ConcurrencyController(scanner.controller.requested, len(scanner.ports),
+                                                   rate=rate, share=share)
+    return scanner
+
+def scan_shard(options, intervals, shard, shards, results):
+    """Entry point of a shard process: scan one interleaved slice and report back"""
+    scanner = create_scanner(options["engine"], options["timeout"], options["max_threads"],
+                             options["concurrency"], options["adaptive_timeout"],
+                             options["min_timeout"], options["fingerprint"], options["ports"],
+                             options["rate"], shards)
+    scanner.sink = QueueSink(results)
+    if options["state_file"]:
+        # The parent already created or validated the file for the whole target set, which may be
+        # larger than the intervals swept here; shards only touch their own bytes
+        scanner.state = ScanState(options["state_file"], options["state_intervals"], resume=True,
+                                  flush_interval=options["checkpoint_interval"])
+    stop = threading.Event()
+    if options["metrics"]:
+        def report_metrics():
+            while not stop.wait(METRICS_INTERVAL):
+                results.put(("metrics", shard, scanner.metrics.snapshot(scanner.controller)))
+        threading.Thread(target=report_metrics, name="shard-metrics", daemon=True).start()
+    try:
+        scanner.scan_targets(iter_intervals(intervals, shard, shards))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if scanner.state is not None:
+            scanner.state.close()
+        results.put(("stats", shard, scanner.metrics.snapshot(scanner.controller)))
+        results.put(None)
 
 class EthereumNodeScanner:
-    def __init__(self, timeout=3, max_threads=1000):
+    def __init__(self, timeout=3, max_threads=1000, window=None, ports=None):
         self.timeout = timeout
         self.max_threads = max_threads
-        self.found_nodes = []
+        # Every host is scheduled once and probed on all of these ports
+        self.ports = ports or [8545]
+        # Probes submitted but not finished; bounds memory whatever the target size
+        self.window = window or max_threads * 2
+        # Deduplicated on (ip, port); iterates as result dicts like a list would
+        self.found_nodes = NodeStore()
         self.lock = threading.Lock()
+        # Optional JsonlResultSink that streams each discovered node to disk
+        self.sink = None
+        # Optional ScanState bitmap of addresses already scanned
+        self.state = None
+        # Merged integer intervals no scan entry point may touch
+        self.excludes = []
+        # Optional RttTracker; when set, connect timeouts adapt per /24 instead of using `timeout`
+        self.connect_rtt = None
+        # When True, probes send the fingerprint batch instead of a lone eth_syncing
+        self.fingerprint = False
+        # Caps probes in flight (and optionally per second) and backs off on local errors
+        self.controller = ConcurrencyController(self.window, len(self.ports))
+        # Lock-free counters and latency histograms for the live metrics endpoint
+        self.metrics = ScanMetrics()
+    
+    def enable_adaptive_timeouts(self, floor, ceiling):
+        """Derive connect timeouts from RTTs measured per /24
+
+        Only connecting adapts, since dead address space is where waiting costs time. A host
+        that accepted the connection keeps the full timeout, so slow but real nodes still count.
+        """
+        self.connect_rtt = RttTracker(floor=floor, ceiling=ceiling)
+    
+    def timeouts_for(self, ip):
+        """Connect and response timeouts for an address"""
+        if self.connect_rtt is None:
+            return self.timeout, self.timeout
+        return self.connect_rtt.timeout(ip_to_int(ip)), self.timeout
+    
+    def observe_rtt(self, kind, ip, started):
+        """Record the "connect" or "response" time elapsed since `started`"""
+        elapsed = time.monotonic() - started
+        self.metrics.observe(kind, elapsed)
+        if kind == "connect" and self.connect_rtt is not None:
+            self.connect_rtt.observe(ip_to_int(ip), elapsed)
         
+    def new_socket(self):
+        """Create a TCP socket, reporting descriptor exhaustion as a local error"""
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            raise LocalResourceError(e.errno, e.strerror)
+    
+    def connect_outcome(self, result):
+        """Classify a connect_ex result; local resource errors are raised, not reported as closed"""
+        outcome = classify_errno(result)
+        if outcome == "local_error":
+            raise LocalResourceError(result, os.strerror(result))
+        return outcome
+    
+    def retry_delay(self, attempt):
+        """Wait before retrying a host after a local error, long enough for in-flight probes to finish"""
+        return self.timeout * min(1, 2 ** attempt / 4)
+    
     def is_port_open(self, ip, port=8545):
         """Check if a port is open on the given IP"""
+        sock = self.new_socket()
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(self.timeout)
             result = sock.connect_ex((ip, port))
-            sock.close()
-            return result == 0
-        except:
+        except OSError:
             return False
+        finally:
+            sock.close()
+        return self.connect_outcome(result) == "open"
     
     def test_ethereum_node(self, ip, port=8545):
         """Test if the IP responds to Ethereum JSON-RPC eth_syncing call"""
+        return self.probe(ip, port)
+    
+    def probe(self, ip, port=8545):
+        """Connect, send eth_syncing and parse the reply on a single connection"""
+        connect_timeout, response_timeout = self.timeouts_for(ip)
+        sock = self.new_socket()
         try:
-            url = f"http://{ip}:{port}"
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_syncing",
-                "params": [],
-                "id": 1
-            }
-            
-            response = requests.post(
-                url, 
-                json=payload, 
-                timeout=self.timeout,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Check if it's a valid JSON-RPC response
-                if "jsonrpc" in data and "id" in data:
-                    return {
-                        "ip": ip,
-                        "port": port,
-                        "response": data,
-                        "status": "active"
-                    }
-        except Exception as e:
-            pass
+            sock.settimeout(connect_timeout)
+            started = time.monotonic()
+            result = sock.connect_ex((ip, port))
+            outcome = self.connect_outcome(result)
+            if outcome in ("open", "closed"):
+                # A refusal still proves the host is up and measures its RTT
+                self.observe_rtt("connect", ip, started)
+            if outcome != "open":
+                self.controller.record(outcome)
+                return None
+            sock.settimeout(response_timeout)
+            started = time.monotonic()
+            sock.sendall(self.request_bytes(ip, port))
+            raw = recv_http_response(sock, started + response_timeout)
+            if raw:
+                self.observe_rtt("response", ip, started)
+            node_info = self.parse_reply(ip, port, raw)
+            self.controller.record("node" if node_info else "open")
+            return node_info
+        except LocalResourceError:
+            raise
+        except socket.timeout:
+            # Connected, but no whole reply before the deadline (e.g. a black hole behind a proxy)
+            self.controller.record("response_timeout")
+        except OSError:
+            self.controller.record("open")
+        finally:
+            sock.close()
         return None
     
-    def scan_ip(self, ip):
-        """Scan a single IP address"""
-        if self.is_port_open(ip, 8545):
-            node_info = self.test_ethereum_node(ip, 8545)
-            if node_info:
-                with self.lock:
-                    self.found_nodes.append(node_info)
-                    print(f"✓ Found Ethereum node: {ip}:8545")
-                    print(f"  Response: {node_info['response']}")
-                    # Auto-save results when new node is found
-                    self.auto_save_results()
-                return node_info
-        return None
+    def probe_ports(self, ip, ports):
+        """Probe several ports of one host concurrently on non-blocking sockets"""
+        connect_timeout, response_timeout = self.timeouts_for(ip)
+        selector = selectors.DefaultSelector()
+        found = []
+        # socket -> [port, unsent request bytes, received bytes, deadline, phase start, connected]
+        conns = {}
+        
+        def finish(sock):
+            selector.unregister(sock)
+            sock.close()
+            del conns[sock]
+        
+        try:
+            started = time.monotonic()
+            for port in ports:
+                sock = self.new_socket()
+                sock.setblocking(False)
+                result = sock.connect_ex((ip, port))
+                if result not in (0, errno.EINPROGRESS):
+                    sock.close()
+                    outcome = self.connect_outcome(result)
+                    if outcome == "closed":
+                        self.observe_rtt("connect", ip, started)
+                    self.controller.record(outcome)
+                    continue
+                conns[sock] = [port, self.request_bytes(ip, port), bytearray(), started + connect_timeout,
+                               started, False]
+                selector.register(sock, selectors.EVENT_WRITE)
+            
+            while conns:
+                now = time.monotonic()
+                for sock in [sock for sock, conn in conns.items() if conn[3] <= now]:
+                    self.controller.record("response_timeout" if conns[sock][5] else "timeout")
+                    finish(sock)
+                if not conns:
+                    break
+                wait = min(conn[3] for conn in conns.values()) - now
+                for key, events in selector.select(max(wait, 0)):
+                    sock = key.fileobj
+                    conn = conns[sock]
+                    if not conn[5]:
+                        outcome = self.connect_outcome(sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR))
+                        if outcome in ("open", "closed"):
+                            # A refusal still proves the host is up and measures its RTT
+                            self.observe_rtt("connect", ip, conn[4])
+                        if outcome != "open":
+                            self.controller.record(outcome)
+                            finish(sock)
+                            continue
+                        # Connected: the response deadline starts now
+                        conn[5] = True
+                        conn[4] = time.monotonic()
+                        conn[3] = conn[4] + response_timeout
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            conn[1] = conn[1][sock.send(conn[1]):]
+                            if not conn[1]:
+                                selector.modify(sock, selectors.EVENT_READ)
+                            continue
+                        chunk = sock.recv(65536)
+                    except OSError:
+                        # A reset on one port ends only that connection, not the host's other ports
+                        self.controller.record("open")
+                        finish(sock)
+                        continue
+                    conn[2] += chunk
+                    state = response_state(conn[2]) if chunk else "complete"
+                    if state is None:
+                        continue
+                    raw = bytes(conn[2]) if state != "reject" else b""
+                    if raw:
+                        self.observe_rtt("response", ip, conn[4])
+                    node_info = self.parse_reply(ip, conn[0], raw)
+                    self.controller.record("node" if node_info else "open")
+                    if node_info:
+                        found.append(node_info)
+                    finish(sock)
+        finally:
+            for sock in list(conns):
+                finish(sock)
+            selector.close()
+        return found
+    
+    def request_bytes(self, ip, port):
+        """Raw request sent to every probed host"""
+        if self.fingerprint:
+            return build_rpc_request(ip, port, FINGERPRINT_REQUEST_TAIL)
+        return build_rpc_request(ip, port)
+    
+    def parse_reply(self, ip, port, raw):
+        """Turn a raw HTTP reply into a node record, or None"""
+        if not self.fingerprint:
+            data = parse_rpc_response(raw)
+            return self.node_info(ip, port, data) if data is not None else None
+        parsed = parse_fingerprint_response(raw)
+        if parsed is None:
+            return None
+        data, fields = parsed
+        node_info = self.node_info(ip, port, data)
+        node_info.update(fields)
+        return node_info
+    
+    def node_info(self, ip, port, data):
+        """Build the result record for a responding node"""
+        return {
+            "ip": ip,
+            "port": port,
+            "response": data,
+            "status": "active"
+        }
+    
+    def scan_ip(self, ip_int):
+        """Scan a single address, given as an integer, on every configured port"""
+        ip = int_to_ip(ip_int)
+        for attempt in range(LOCAL_RETRIES):
+            try:
+                if len(self.ports) == 1:
+                    node_info = self.probe(ip, self.ports[0])
+                    found = [node_info] if node_info else []
+                else:
+                    found = self.probe_ports(ip, self.ports)
+                break
+            except LocalResourceError as e:
+                self.controller.backoff(e)
+                # Retry under the slot this thread already holds: blocking in acquire() here
+                # deadlocks once every pool thread waits while queued hosts hold the slots.
+                # The reduced limit still holds back new submissions until probes drain.
+                time.sleep(self.retry_delay(attempt))
+        else:
+            # Never actually tested; left unmarked so a resumed scan retries it
+            self.controller.record("skipped")
+            return []
+        self.metrics.host_done()
+        for node_info in found:
+            self.record_node(node_info)
+        if self.state is not None:
+            self.state.mark(ip_int)
+        return found
+    
+    def record_node(self, node_info):
+        """Store a discovered node and report it, unless an overlapping range already found it"""
+        if not self.found_nodes.add(node_info):
+            return
+        with self.lock:
+            print(f"✓ Found Ethereum node: {node_info['ip']}:{node_info['port']}")
+            print(f"  Response: {node_info['response']}")
+        if self.sink is not None:
+            self.sink.write(node_info)
+    
+    def remaining(self, ips):
+        """Skip addresses the checkpoint state marks as already scanned"""
+        if self.state is None:
+            return ips
+        return (ip_int for ip_int in ips if not self.state.is_done(ip_int))
     
     def scan_network_range(self, network):
         """Scan a network range for Ethereum nodes"""
         print(f"Scanning network: {network}")
         try:
-            network_obj = ipaddress.ip_network(network, strict=False)
-            ips = [str(ip) for ip in network_obj.hosts()]
-            
-            with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-                futures = {executor.submit(self.scan_ip, ip): ip for ip in ips}
-                
-                for future in as_completed(futures):
-                    ip = futures[future]
-                    try:
-                        result = future.result()
-                    except Exception as e:
-                        pass
-                        
+            self.scan_targets(iter(TargetSet([network_interval(network)], self.excludes)))
         except Exception as e:
             print(f"Error scanning network {network}: {e}")
     
+    def scan_targets(self, ips):
+        """Scan integer addresses from an iterator, keeping pending probes within the controller's limit"""
+        def release(future):
+            if future.exception() is not None:
+                # A bug hit by one host must not go unnoticed; the host stays unmarked for a resume
+                self.controller.record("error")
+            self.controller.release()
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_threads, self.controller.max_limit)) as executor:
+            for ip_int in self.remaining(ips):
+                self.controller.acquire()
+                executor.submit(self.scan_ip, ip_int).add_done_callback(release)
+    
     def scan_common_ranges(self):
         """Scan common private network ranges"""
-        common_ranges = [
-            "192.168.0.0/16",    # Class C private
-            "10.0.0.0/8",        # Class A private
-            "172.16.0.0/12",     # Class B private
-            "127.0.0.0/8",       # Loopback
-        ]
-        
-        for network in common_ranges:
-            self.scan_network_range(network)
+        targets = TargetSet([network_interval(network) for network in COMMON_RANGES], self.excludes)
+        print(f"Scanning networks: {', '.join(COMMON_RANGES)} ({len(targets)} addresses)")
+        self.scan_targets(iter(targets))
     
     def scan_asia_europe_ranges(self):
         """Scan major Asia and Europe IP ranges"""
-        # Major Asia IP ranges (using /16 instead of /8 to avoid huge scans)
-        asia_ranges = [
-            "1.1.0.0/16",        # APNIC - Asia Pacific
-            "1.2.0.0/16",        # APNIC - Asia Pacific
-            "1.3.0.0/16",        # APNIC - Asia Pacific
-            "14.0.0.0/16",       # APNIC - Asia Pacific
-            "14.1.0.0/16",       # APNIC - Asia Pacific
-            "27.0.0.0/16",       # APNIC - Asia Pacific
-            "27.1.0.0/16",       # APNIC - Asia Pacific
-            "36.0.0.0/16",       # APNIC - Asia Pacific
-            "36.1.0.0/16",       # APNIC - Asia Pacific
-            "39.0.0.0/16",       # APNIC - Asia Pacific
-            "42.0.0.0/16",       # APNIC - Asia Pacific
-            "49.0.0.0/16",       # APNIC - Asia Pacific
-            "58.0.0.0/16",       # APNIC - Asia Pacific
-            "58.1.0.0/16",       # APNIC - Asia Pacific
-            "59.0.0.0/16",       # APNIC - Asia Pacific
-            "60.0.0.0/16",       # APNIC - Asia Pacific
-            "60.1.0.0/16",       # APNIC - Asia Pacific
-            "61.0.0.0/16",       # APNIC - Asia Pacific
-            "61.1.0.0/16",       # APNIC - Asia Pacific
-            "101.0.0.0/16",      # APNIC - Asia Pacific
-            "101.1.0.0/16",      # APNIC - Asia Pacific
-            "103.0.0.0/16",      # APNIC - Asia Pacific
-            "103.1.0.0/16",      # APNIC - Asia Pacific
-            "106.0.0.0/16",      # APNIC - Asia Pacific
-            "110.0.0.0/16",      # APNIC - Asia Pacific
-            "110.1.0.0/16",      # APNIC - Asia Pacific
-            "111.0.0.0/16",      # APNIC - Asia Pacific
-            "112.0.0.0/16",      # APNIC - Asia Pacific
-            "113.0.0.0/16",      # APNIC - Asia Pacific
-            "114.0.0.0/16",      # APNIC - Asia Pacific
-            "115.0.0.0/16",      # APNIC - Asia Pacific
-            "116.0.0.0/16",      # APNIC - Asia Pacific
-            "117.0.0.0/16",      # APNIC - Asia Pacific
-            "118.0.0.0/16",      # APNIC - Asia Pacific
-            "119.0.0.0/16",      # APNIC - Asia Pacific
-            "120.0.0.0/16",      # APNIC - Asia Pacific
-            "121.0.0.0/16",      # APNIC - Asia Pacific
-            "122.0.0.0/16",      # APNIC - Asia Pacific
-            "123.0.0.0/16",      # APNIC - Asia Pacific
-            "124.0.0.0/16",      # APNIC - Asia Pacific
-            "125.0.0.0/16",      # APNIC - Asia Pacific
-            "126.0.0.0/16",      # APNIC - Asia Pacific
-            "175.0.0.0/16",      # APNIC - Asia Pacific
-            "180.0.0.0/16",      # APNIC - Asia Pacific
-            "182.0.0.0/16",      # APNIC - Asia Pacific
-            "183.0.0.0/16",      # APNIC - Asia Pacific
-            "202.0.0.0/16",      # APNIC - Asia Pacific
-            "202.1.0.0/16",      # APNIC - Asia Pacific
-            "203.0.0.0/16",      # APNIC - Asia Pacific
-            "210.0.0.0/16",      # APNIC - Asia Pacific
-            "210.1.0.0/16",      # APNIC - Asia Pacific
-            "211.0.0.0/16",      # APNIC - Asia Pacific
-            "218.0.0.0/16",      # APNIC - Asia Pacific
-            "218.1.0.0/16",      # APNIC - Asia Pacific
-            "219.0.0.0/16",      # APNIC - Asia Pacific
-            "220.0.0.0/16",      # APNIC - Asia Pacific
-            "221.0.0.0/16",      # APNIC - Asia Pacific
-            "222.0.0.0/16",      # APNIC - Asia Pacific
-            "223.0.0.0/16",      # APNIC - Asia Pacific
-        ]
-        
-        # Major Europe IP ranges (using /16 instead of /8 to avoid huge scans)
-        europe_ranges = [
-            "2.0.0.0/16",        # RIPE NCC - Europe
-            "2.1.0.0/16",        # RIPE NCC - Europe
-            "5.0.0.0/16",        # RIPE NCC - Europe
-            "5.1.0.0/16",        # RIPE NCC - Europe
-            "31.0.0.0/16",       # RIPE NCC - Europe
-            "31.1.0.0/16",       # RIPE NCC - Europe
-            "37.0.0.0/16",       # RIPE NCC - Europe
-            "46.0.0.0/16",       # RIPE NCC - Europe
-            "46.1.0.0/16",       # RIPE NCC - Europe
-            "51.0.0.0/16",       # RIPE NCC - Europe
-            "51.1.0.0/16",       # RIPE NCC - Europe
-            "62.0.0.0/16",       # RIPE NCC - Europe
-            "77.0.0.0/16",       # RIPE NCC - Europe
-            "77.1.0.0/16",       # RIPE NCC - Europe
-            "78.0.0.0/16",       # RIPE NCC - Europe
-            "79.0.0.0/16",       # RIPE NCC - Europe
-            "80.0.0.0/16",       # RIPE NCC - Europe
-            "80.1.0.0/16",       # RIPE NCC - Europe
-            "81.0.0.0/16",       # RIPE NCC - Europe
-            "82.0.0.0/16",       # RIPE NCC - Europe
-            "83.0.0.0/16",       # RIPE NCC - Europe
-            "84.0.0.0/16",       # RIPE NCC - Europe
-            "85.0.0.0/16",       # RIPE NCC - Europe
-            "86.0.0.0/16",       # RIPE NCC - Europe
-            "87.0.0.0/16",       # RIPE NCC - Europe
-            "88.0.0.0/16",       # RIPE NCC - Europe
-            "89.0.0.0/16",       # RIPE NCC - Europe
-            "90.0.0.0/16",       # RIPE NCC - Europe
-            "91.0.0.0/16",       # RIPE NCC - Europe
-            "92.0.0.0/16",       # RIPE NCC - Europe
-            "93.0.0.0/16",       # RIPE NCC - Europe
-            "94.0.0.0/16",       # RIPE NCC - Europe
-            "95.0.0.0/16",       # RIPE NCC - Europe
-            "109.0.0.0/16",      # RIPE NCC - Europe
-            "128.0.0.0/16",      # RIPE NCC - Europe
-            "128.1.0.0/16",      # RIPE NCC - Europe
-            "129.0.0.0/16",      # RIPE NCC - Europe
-            "130.0.0.0/16",      # RIPE NCC - Europe
-            "131.0.0.0/16",      # RIPE NCC - Europe
-            "132.0.0.0/16",      # RIPE NCC - Europe
-            "133.0.0.0/16",      # RIPE NCC - Europe
-            "134.0.0.0/16",      # RIPE NCC - Europe
-            "135.0.0.0/16",      # RIPE NCC - Europe
-            "136.0.0.0/16",      # RIPE NCC - Europe
-            "137.0.0.0/16",      # RIPE NCC - Europe
-            "137.1.0.0/16",      # RIPE NCC - Europe
-            "138.0.0.0/16",      # RIPE NCC - Europe
-            "139.0.0.0/16",      # RIPE NCC - Europe
-            "140.0.0.0/16",      # RIPE NCC - Europe
-            "141.0.0.0/16",      # RIPE NCC - Europe
-            "142.0.0.0/16",      # RIPE NCC - Europe
-            "143.0.0.0/16",      # RIPE NCC - Europe
-            "144.0.0.0/16",      # RIPE NCC - Europe
-            "145.0.0.0/16",      # RIPE NCC - Europe
-            "146.0.0.0/16",      # RIPE NCC - Europe
-            "147.0.0.0/16",      # RIPE NCC - Europe
-            "148.0.0.0/16",      # RIPE NCC - Europe
-            "149.0.0.0/16",      # RIPE NCC - Europe
-            "150.0.0.0/16",      # RIPE NCC - Europe
-            "151.0.0.0/16",      # RIPE NCC - Europe
-            "152.0.0.0/16",      # RIPE NCC - Europe
-            "153.0.0.0/16",      # RIPE NCC - Europe
-            "154.0.0.0/16",      # RIPE NCC - Europe
-            "155.0.0.0/16",      # RIPE NCC - Europe
-            "156.0.0.0/16",      # RIPE NCC - Europe
-            "157.0.0.0/16",      # RIPE NCC - Europe
-            "158.0.0.0/16",      # RIPE NCC - Europe
-            "159.0.0.0/16",      # RIPE NCC - Europe
-            "160.0.0.0/16",      # RIPE NCC - Europe
-            "161.0.0.0/16",      # RIPE NCC - Europe
-            "162.0.0.0/16",      # RIPE NCC - Europe
-            "163.0.0.0/16",      # RIPE NCC - Europe
-            "164.0.0.0/16",      # RIPE NCC - Europe
-            "165.0.0.0/16",      # RIPE NCC - Europe
-            "166.0.0.0/16",      # RIPE NCC - Europe
-            "167.0.0.0/16",      # RIPE NCC - Europe
-            "168.0.0.0/16",      # RIPE NCC - Europe
-            "169.0.0.0/16",      # RIPE NCC - Europe
-            "170.0.0.0/16",      # RIPE NCC - Europe
-            "171.0.0.0/16",      # RIPE NCC - Europe
-            "172.0.0.0/16",      # RIPE NCC - Europe
-            "173.0.0.0/16",      # RIPE NCC - Europe
-            "174.0.0.0/16",      # RIPE NCC - Europe
-            "176.0.0.0/16",      # RIPE NCC - Europe
-            "177.0.0.0/16",      # RIPE NCC - Europe
-            "178.0.0.0/16",      # RIPE NCC - Europe
-            "179.0.0.0/16",      # RIPE NCC - Europe
-            "181.0.0.0/16",      # RIPE NCC - Europe
-            "185.0.0.0/16",      # RIPE NCC - Europe
-            "188.0.0.0/16",      # RIPE NCC - Europe
-            "193.0.0.0/16",      # RIPE NCC - Europe
-            "193.1.0.0/16",      # RIPE NCC - Europe
-            "194.0.0.0/16",      # RIPE NCC - Europe
-            "195.0.0.0/16",      # RIPE NCC - Europe
-            "212.0.0.0/16",      # RIPE NCC - Europe
-            "212.1.0.0/16",      # RIPE NCC - Europe
-            "213.0.0.0/16",      # RIPE NCC - Europe
-        ]
+        all_ranges = ASIA_RANGES + EUROPE_RANGES
         
-        all_ranges = asia_ranges + europe_ranges
-        
-        print(f"Scanning {len(asia_ranges)} Asia IP ranges and {len(europe_ranges)} Europe IP ranges...")
+        print(f"Scanning {len(ASIA_RANGES)} Asia IP ranges and {len(EUROPE_RANGES)} Europe IP ranges...")
         print("WARNING: This will scan millions of IP addresses and may take a very long time!")
         print("Press Ctrl+C to stop at any time.")
         
-        for i, network in enumerate(all_ranges, 1):
-            print(f"\n[{i}/{len(all_ranges)}] Scanning {network}...")
-            self.scan_network_range(network)
+        # Overlapping blocks are merged, so every address is probed once
+        targets = TargetSet([network_interval(network) for network in all_ranges], self.excludes)
+        print(f"{len(all_ranges)} ranges merged into {len(targets.intervals)} intervals, {len(targets)} addresses")
+        self.scan_targets(iter(targets))
     
     def scan_public_range(self, start_ip, end_ip):
         """Scan a specific public IP range (use with caution)"""
+        print(f"Scanning range: {start_ip} - {end_ip}")
         try:
-            start = ipaddress.ip_address(start_ip)
-            end = ipaddress.ip_address(end_ip)
-            
-            current = start
-            while current <= end:
-                self.scan_ip(str(current))
-                current += 1
-                
+            self.scan_targets(iter(TargetSet([range_interval(start_ip, end_ip)], self.excludes)))
         except Exception as e:
             print(f"Error scanning public range: {e}")
     
-    def auto_save_results(self):
-        """Auto-save results when new node is found"""
+    def scan_sharded(self, intervals, shards, options):
+        """Split the target intervals into interleaved shards, one process each, and merge results"""
+        print(f"Scanning {len(intervals)} range(s) with {shards} worker processes...")
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers = [
+            context.Process(target=scan_shard, args=(options, intervals, shard, shards, results),
+                            name=f"scan-shard-{shard}", daemon=True)
+            for shard in range(shards)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        running = shards
+        interrupted = False
         try:
-            results = {
-                "scan_time": datetime.now().isoformat(),
-                "total_nodes_found": len(self.found_nodes),
-                "nodes": self.found_nodes
-            }
-            
-            # Save to both current results and timestamped file
-            with open("ethereum_nodes_current.json", 'w') as f:
-                json.dump(results, f, indent=2)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"ethereum_nodes_{timestamp}.json"
-            with open(filename, 'w') as f:
-                json.dump(results, f, indent=2)
-                
-            print(f"  💾 Auto-saved to: ethereum_nodes_current.json")
-            
-        except Exception as e:
-            print(f"  ❌ Error auto-saving: {e}")
+            while running:
+                try:
+                    message = results.get(timeout=1)
+                    if message is None:
+                        running -= 1
+                    else:
+                        self.merge_shard_message(message)
+                except queue.Empty:
+                    # A shard that died without reporting must not hang the merge
+                    running = min(running, sum(worker.is_alive() for worker in workers))
+                except KeyboardInterrupt:
+                    if interrupted:
+                        raise
+                    # Ctrl+C reached the shards too; keep merging until each one has reported back
+                    interrupted = True
+                    print("\nStopping worker processes, collecting what they already found...")
+        except KeyboardInterrupt:
+            # A second Ctrl+C stops waiting for the shards
+            for worker in workers:
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+        if interrupted:
+            raise KeyboardInterrupt
+    
+    def merge_shard_message(self, message):
+        """Fold one node, metrics or final stats message from a shard process into this scanner"""
+        if message[0] == "metrics":
+            self.metrics.remote[message[1]] = message[2]
+        elif message[0] == "stats":
+            snapshot = message[2]
+            for name, count in snapshot.pop("outcomes").items():
+                self.controller.record(name, count)
+            for name, count in snapshot.pop("local_errors").items():
+                self.controller.local_errors[name] = self.controller.local_errors.get(name, 0) + count
+            # Outcomes now live in the controller; keep host counts and latencies for metrics
+            snapshot.update(inflight=0, limit=0)
+            self.metrics.remote[message[1]] = snapshot
+        elif self.found_nodes.add(message[1]) and self.sink is not None:
+            self.sink.write(message[1])
     
     def save_results(self, filename=None):
         """Save results to file"""
@@ -333,7 +871,7 @@ class EthereumNodeScanner:
         results = {
             "scan_time": datetime.now().isoformat(),
             "total_nodes_found": len(self.found_nodes),
-            "nodes": self.found_nodes
+            "nodes": list(self.found_nodes)
         }
         
         with open(filename, 'w') as f:
@@ -349,6 +887,12 @@ class EthereumNodeScanner:
         print(f"{'='*50}")
         print(f"Total Ethereum nodes found: {len(self.found_nodes)}")
         print(f"Scan completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        outcomes = self.controller.outcomes
+        if outcomes:
+            print("Probe outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(outcomes.items())))
+        if self.controller.local_errors:
+            errors = ", ".join(f"{name}={count}" for name, count in sorted(self.controller.local_errors.items()))
+            print(f"⚠️  Local resource errors (hosts retried or skipped, not closed): {errors}")
         
         if self.found_nodes:
             print(f"\nFound nodes:")
@@ -357,44 +901,371 @@ class EthereumNodeScanner:
                 if 'response' in node:
                     syncing = node['response'].get('result', 'unknown')
                     print(f"     Syncing status: {syncing}")
+                if node.get('chain_id') is not None or node.get('client_version'):
+                    print(f"     Chain ID: {node.get('chain_id')}, Block: {node.get('block_number')}, "
+                          f"Client: {node.get('client_version')}")
+
+class AsyncEthereumNodeScanner(EthereumNodeScanner):
+    """Scanner that drives every probe from a single asyncio event loop"""
+    
+    def __init__(self, timeout=3, max_threads=1000, concurrency=10000, ports=None):
+        super().__init__(timeout=timeout, max_threads=max_threads, ports=ports)
+        self.concurrency = concurrency
+        self.controller = ConcurrencyController(concurrency, len(self.ports))
+    
+    async def probe_async(self, ip, port=8545):
+        """Connect, send eth_syncing and parse the reply on one non-blocking connection"""
+        connect_timeout, response_timeout = self.timeouts_for(ip)
+        writer = None
+        try:
+            started = time.monotonic()
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ip, port), connect_timeout
+                )
+            except asyncio.TimeoutError:
+                self.controller.record("timeout")
+                return None
+            except OSError as e:
+                outcome = self.connect_outcome(e.errno or 0)
+                if outcome == "closed":
+                    # A refusal still proves the host is up and measures its RTT
+                    self.observe_rtt("connect", ip, started)
+                self.controller.record(outcome if outcome != "open" else "unreachable")
+                return None
+            self.observe_rtt("connect", ip, started)
+            started = time.monotonic()
+            writer.write(self.request_bytes(ip, port))
+            raw = await asyncio.wait_for(self.read_response(reader), response_timeout)
+            if raw:
+                self.observe_rtt("response", ip, started)
+            node_info = self.parse_reply(ip, port, raw)
+            self.controller.record("node" if node_info else "open")
+            return node_info
+        except asyncio.TimeoutError:
+            # Checked before OSError: since Python 3.11 it is the builtin TimeoutError
+            self.controller.record("response_timeout")
+        except OSError as e:
+            if isinstance(e, LocalResourceError):
+                raise
+            self.controller.record("open")
+        finally:
+            if writer is not None:
+                writer.close()
+        return None
+    
+    async def read_response(self, reader):
+        """Read a whole HTTP response from a stream"""
+        return await read_http_response(reader)
+    
+    async def scan_ip_async(self, ip_int):
+        """Scan a single address, given as an integer, on every configured port without blocking the event loop"""
+        ip = int_to_ip(ip_int)
+        ports = self.ports
+        found = []
+        for attempt in range(LOCAL_RETRIES):
+            if len(ports) == 1:
+                try:
+                    results = [await self.probe_async(ip, ports[0])]
+                except LocalResourceError as e:
+                    results = [e]
+            else:
+                # Every port's probe finishes before a retry, so none is left running outside the slot
+                results = await asyncio.gather(*(self.probe_async(ip, port) for port in ports),
+                                               return_exceptions=True)
+            failed, error = [], None
+            for port, result in zip(ports, results):
+                if isinstance(result, LocalResourceError):
+                    failed.append(port)
+                    error = result
+                elif isinstance(result, BaseException):
+                    raise result
+                elif result:
+                    found.append(result)
+            if not failed:
+                break
+            # Only the ports that were never tested are probed again
+            ports = failed
+            self.controller.backoff(error)
+            # Retry only once in-flight probes are back under the reduced limit
+            self.controller.yield_slot()
+            await asyncio.sleep(self.retry_delay(attempt))
+            await self.controller.acquire_async()
+        else:
+            # Some ports were never tested; left unmarked so a resumed scan retries the host
+            self.controller.record("skipped")
+            for node_info in found:
+                self.record_node(node_info)
+            return found
+        self.metrics.host_done()
+        for node_info in found:
+            self.record_node(node_info)
+        if self.state is not None:
+            self.state.mark(ip_int)
+        return found
+    
+    async def scan_hosts(self, ips):
+        """Probe hosts from an iterator with at most the controller's limit in flight"""
+        async def worker():
+            # Workers share the iterator, so each host is handed out exactly once
+            for ip in ips:
+                await self.controller.acquire_async()
+                try:
+                    await self.scan_ip_async(ip)
+                except Exception:
+                    # One misbehaving host must not abort the whole event loop
+                    self.controller.record("error")
+                finally:
+                    self.controller.release()
+        
+        await asyncio.gather(*(worker() for _ in range(self.controller.max_limit)))
+    
+    def scan_targets(self, ips):
+        """Scan IPs from an iterator on the event loop"""
+        asyncio.run(self.scan_hosts(self.remaining(ips)))
+
+def target_set(args):
+    """Addresses of the selected scan mode plus --targets/--targets-file, minus --exclude/--exclude-file"""
+    if args.network:
+        intervals = [network_interval(args.network)]
+    elif args.ip_range:
+        intervals = [range_interval(args.ip_range[0], args.ip_range[1])]
+    elif args.asia_europe:
+        intervals = [network_interval(network) for network in ASIA_RANGES + EUROPE_RANGES]
+    elif args.common or not (args.targets or args.targets_file):
+        intervals = [network_interval(network) for network in COMMON_RANGES]
+    else:
+        intervals = []
+    return TargetSet.parse(args.targets or [], args.exclude or [], args.targets_file or [],
+                           args.exclude_file or [], intervals)
+
+def scan_options(args, state_intervals):
+    """Scanner settings handed to shard processes; `state_intervals` is the set the state file covers"""
+    return {
+        "engine": args.engine,
+        "timeout": args.timeout,
+        "max_threads": args.threads,
+        "concurrency": args.concurrency,
+        "adaptive_timeout": args.adaptive_timeout,
+        "min_timeout": args.min_timeout,
+        "fingerprint": args.fingerprint,
+        "ports": args.ports,
+        "rate": args.rate,
+        "state_file": args.state_file,
+        "state_intervals": state_intervals,
+        "checkpoint_interval": args.checkpoint_interval,
+        "metrics": args.metrics_port is not None,
+    }
+
+def scan_incremental(scanner, cache, intervals, args):
+    """Re-verify cached endpoints, then re-sweep only blocks whose TTL expired
+
+    Returns the blocks that were swept.
+    """
+    excluded = TargetSet(scanner.excludes)
+    known = [(ip, port) for ip, port in cache.known_endpoints() if ip_to_int(ip) not in excluded]
+    known_ips = sorted({ip_to_int(ip) for ip, _ in known})
+    stale = cache.stale_blocks(intervals)
+    scanner.metrics.target_hosts = len(known_ips) + sum(last - first + 1 for first, last in stale)
+    print(f"Re-verifying {len(known)} known endpoint(s) on {len(known_ips)} host(s)...")
+    if known:
+        ports = scanner.ports
+        scanner.ports = sorted({port for _, port in known} | set(ports))
+        scanner.scan_targets(iter(known_ips))
+        scanner.ports = ports
+    
+    print(f"Re-sweeping {len(stale)} of {len(split_intervals(intervals))} block(s) whose TTL expired...")
+    if args.workers > 1:
+        scanner.scan_sharded(stale, args.workers, scan_options(args, intervals))
+    elif stale:
+        verified = set(known_ips)
+        scanner.scan_targets(ip_int for ip_int in iter_intervals(stale) if ip_int not in verified)
+    return stale
+
+def report_diff(diff, filename=None):
+    """Print the changes since the previous run and save them"""
+    print(f"\n{'='*50}")
+    print(f"CHANGES SINCE PREVIOUS RUN")
+    print(f"{'='*50}")
+    print(f"New: {len(diff['new'])}, Gone: {len(diff['gone'])}, Changed: {len(diff['changed'])}")
+    for node in diff["new"]:
+        print(f"  + {node['ip']}:{node['port']}")
+    for node in diff["gone"]:
+        print(f"  - {node['ip']}:{node['port']}")
+    for node in diff["changed"]:
+        print(f"  ~ {node['ip']}:{node['port']} {node['before']} -> {node['after']}")
+    
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"ethereum_nodes_diff_{timestamp}.json"
+    with open(filename, 'w') as f:
+        json.dump(dict(diff, scan_time=datetime.now().isoformat()), f, indent=2)
+    print(f"Diff saved to: {filename}")
 
 def main():
-    parser = argparse.ArgumentParser(description="Scan for Ethereum nodes on port 8545")
+    parser = argparse.ArgumentParser(description="Scan for Ethereum nodes on port 8545 (or --ports)")
     parser.add_argument("--network", help="Network range to scan (e.g., 192.168.1.0/24)")
     parser.add_argument("--ip-range", nargs=2, metavar=("START", "END"), 
                        help="IP range to scan (e.g., 192.168.1.1 192.168.1.254)")
-    parser.add_argument("--timeout", type=int, default=3, help="Connection timeout in seconds")
+    parser.add_argument("--targets", nargs="+", metavar="TARGET",
+                       help="CIDRs, START-END ranges or single IPs to scan (merged with the mode's ranges)")
+    parser.add_argument("--targets-file", action="append",
+                       help="File of targets, one or more per line, # for comments (repeatable)")
+    parser.add_argument("--exclude", nargs="+", metavar="TARGET",
+                       help="CIDRs, ranges or IPs that are never probed, in every scan mode")
+    parser.add_argument("--exclude-file", action="append",
+                       help="File of excluded targets, same format as --targets-file (repeatable)")
+    parser.add_argument("--ports", type=parse_ports, default=[8545],
+                       help="Comma-separated RPC ports probed on every host (e.g., 8545,8546)")
+    parser.add_argument("--timeout", type=float, default=3,
+                       help="Connection timeout in seconds (the ceiling with --adaptive-timeout)")
+    parser.add_argument("--adaptive-timeout", action="store_true",
+                       help="Derive connect timeouts per /24 from measured connect RTTs")
+    parser.add_argument("--min-timeout", type=float, default=0.2,
+                       help="Floor in seconds for adaptive timeouts")
     parser.add_argument("--threads", type=int, default=1000, help="Maximum number of threads")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread",
+                       help="Scan engine: thread pool or single asyncio event loop")
+    parser.add_argument("--concurrency", type=int, default=10000,
+                       help="Maximum probes in flight for the async engine (keep below ulimit -n)")
+    parser.add_argument("--rate", type=float,
+                       help="Maximum connection attempts per second across all worker processes")
+    parser.add_argument("--fingerprint", action="store_true",
+                       help="Also fetch chainId, net_version, client version and block height in one batch")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Number of scan processes; targets are split into interleaved shards")
     parser.add_argument("--output", help="Output filename for results")
+    parser.add_argument("--stream-file", default="ethereum_nodes_current.jsonl",
+                       help="JSON Lines file that receives each node as it is found")
+    parser.add_argument("--state-file", help="Checkpoint bitmap of scanned addresses (enables resume)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Skip addresses already marked in --state-file")
+    parser.add_argument("--checkpoint-interval", type=float, default=10,
+                       help="Seconds between flushes of the state file")
+    parser.add_argument("--cache-file",
+                       help="Known-endpoint cache updated after each run (default with --incremental: "
+                            "ethereum_endpoints_cache.json)")
+    parser.add_argument("--incremental", action="store_true",
+                       help="Re-verify cached endpoints and re-sweep only blocks whose TTL expired")
+    parser.add_argument("--endpoint-ttl", type=float, default=168,
+                       help="Hours an endpoint stays cached after it was last seen")
+    parser.add_argument("--range-ttl", type=float, default=6,
+                       help="Hours before a /16 block with endpoints is re-swept")
+    parser.add_argument("--dead-range-ttl", type=float, default=24,
+                       help="Hours before a /16 block without endpoints is re-swept")
+    parser.add_argument("--diff-output", help="Output filename for the diff against the previous run")
+    parser.add_argument("--history-db",
+                       help="SQLite database that keeps every scan's nodes (see the query subcommand)")
+    parser.add_argument("--metrics-port", type=int,
+                       help="Serve live Prometheus metrics on this port (e.g., 9100)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                       help="Address the metrics endpoint binds to (0.0.0.0 inside Docker)")
     parser.add_argument("--common", action="store_true", help="Scan common private network ranges")
     parser.add_argument("--asia-europe", action="store_true", help="Scan major Asia and Europe IP ranges (WARNING: Very large scan)")
     
+    subcommands = parser.add_subparsers(dest="command", metavar="{query,ingest,watch,coordinator,worker}",
+                                        help="Query or fill the --history-db database, watch known endpoints, "
+                                             "or split a scan across worker processes")
+    add_history_commands(subcommands)
+    # watch and cluster build on this module's scanner, so they can only be imported once it exists
+    from watch import add_watch_command
+    from cluster import add_cluster_commands
+    add_watch_command(subcommands)
+    add_cluster_commands(subcommands)
+    
     args = parser.parse_args()
+    if args.command:
+        args.func(args)
+        return
+    try:
+        targets = target_set(args)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
     
-    scanner = EthereumNodeScanner(timeout=args.timeout, max_threads=args.threads)
+    scanner = create_scanner(args.engine, args.timeout, args.threads, args.concurrency,
+                             args.adaptive_timeout, args.min_timeout, args.fingerprint, args.ports,
+                             args.rate)
+    scanner.excludes = targets.excludes
     
     print("Ethereum Node Scanner")
     print("=" * 50)
-    print(f"Scanning for Ethereum nodes on port 8545...")
-    print(f"Timeout: {args.timeout}s, Threads: {args.threads}")
+    print(f"Scanning for Ethereum nodes on port(s) {', '.join(map(str, args.ports))}...")
+    if args.engine == "async":
+        print(f"Timeout: {args.timeout}s, Engine: async, Concurrency: {args.concurrency} hosts")
+    else:
+        print(f"Timeout: {args.timeout}s, Threads: {args.threads}")
+    print(f"Concurrency: {scanner.controller.describe()}")
+    if args.rate:
+        print(f"Rate limit: {args.rate:g} connection attempts/s")
+    if args.adaptive_timeout:
+        print(f"Adaptive timeouts: {args.min_timeout}s - {args.timeout}s")
+    if args.workers > 1:
+        print(f"Worker processes: {args.workers}")
+    if targets.excludes:
+        print(f"Excluded: {len(targets.excludes)} range(s), never probed")
+    print(f"Streaming results to: {args.stream_file}")
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(lambda: scanner.metrics.render(scanner.controller, len(scanner.found_nodes)),
+                                       args.metrics_port, args.metrics_host).start()
+        print(f"Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
     print()
     
+    if args.state_file:
+        scanner.state = ScanState(args.state_file, targets.intervals, resume=args.resume,
+                                  flush_interval=args.checkpoint_interval)
+        if scanner.state.resumed:
+            print(f"Resuming from {args.state_file}: {scanner.state.count_done()} addresses already scanned")
+            # Nodes found before the interruption are already in the stream file
+            if os.path.exists(args.stream_file):
+                scanner.found_nodes.extend(read_jsonl(args.stream_file))
+            scanner.metrics.done_before = scanner.state.count_done()
+    
+    resumed = scanner.state is not None and scanner.state.resumed
+    scanner.sink = JsonlResultSink(args.stream_file, append=resumed)
+    
+    cache = None
+    if args.incremental or args.cache_file:
+        cache = EndpointCache(args.cache_file or "ethereum_endpoints_cache.json",
+                              endpoint_ttl=args.endpoint_ttl * 3600, range_ttl=args.range_ttl * 3600,
+                              dead_range_ttl=args.dead_range_ttl * 3600)
+    intervals = targets.intervals
+    swept = split_intervals(intervals)
+    scanner.metrics.target_hosts = sum(last - first + 1 for first, last in intervals)
+    completed = False
+    
     start_time = time.time()
     
-    if args.network:
-        scanner.scan_network_range(args.network)
-    elif args.ip_range:
-        scanner.scan_public_range(args.ip_range[0], args.ip_range[1])
-    elif args.asia_europe:
-        scanner.scan_asia_europe_ranges()
-    elif args.common:
-        scanner.scan_common_ranges()
-    else:
-        # Default: scan common private ranges
-        print("No specific range specified, scanning common private networks...")
-        scanner.scan_common_ranges()
+    try:
+        if args.incremental:
+            swept = scan_incremental(scanner, cache, intervals, args)
+        elif args.workers > 1:
+            scanner.scan_sharded(intervals, args.workers, scan_options(args, intervals))
+        elif args.targets or args.targets_file:
+            print(f"Scanning {len(intervals)} merged interval(s), {len(targets)} addresses")
+            scanner.scan_targets(iter(targets))
+        elif args.network:
+            scanner.scan_network_range(args.network)
+        elif args.ip_range:
+            scanner.scan_public_range(args.ip_range[0], args.ip_range[1])
+        elif args.asia_europe:
+            scanner.scan_asia_europe_ranges()
+        elif args.common:
+            scanner.scan_common_ranges()
+        else:
+            # Default: scan common private ranges
+            print("No specific range specified, scanning common private networks...")
+            scanner.scan_common_ranges()
+        completed = True
+    except KeyboardInterrupt:
+        print("\nScan interrupted, writing out results found so far...")
     
     end_time = time.time()
+    if metrics_server is not None:
+        metrics_server.close()
+    scanner.sink.close()
+    if scanner.state is not None:
+        scanner.state.close()
     
     scanner.print_summary()
     
@@ -402,6 +1273,22 @@ def main():
         filename = scanner.save_results(args.output)
         print(f"\nDetailed results saved to: {filename}")
     
+    if args.history_db:
+        history = HistoryStore(args.history_db)
+        scan_id = history.record_scan(scanner.found_nodes, start_time, end_time, completed,
+                                      source=" ".join(sys.argv[1:]))
+        history.close()
+        print(f"History: scan #{scan_id} recorded in {args.history_db}")
+    
+    if cache is not None and completed:
+        # An incremental run re-verified every cached endpoint not excluded; a full one only those it swept
+        verified = cache.endpoints_within(TargetSet([(0, 0xffffffff)], targets.excludes).intervals
+                                          if args.incremental else intervals)
+        report_diff(cache.diff(scanner.found_nodes, verified), args.diff_output)
+        cache.update(scanner.found_nodes, swept, verified)
+        cache.save()
+        print(f"Endpoint cache updated: {cache.filename}")
+    
     print(f"\nScan completed in {end_time - start_time:.2f} seconds")
 
 if __name__ == "__main__":
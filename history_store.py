@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+SQLite scan history
+Stores every scan's nodes in batched transactions, indexed by address, port, scan and chain id,
+and answers CIDR / status / time-window queries without reading the JSON snapshots
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import ipaddress
+from datetime import datetime, timezone
+
+from endpoint_cache import int_to_ip, sync_state
+from scan_state import ip_to_int
+from result_sink import read_jsonl
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    completed INTEGER NOT NULL DEFAULT 1,
+    source TEXT,
+    nodes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS observations (
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    ip INTEGER NOT NULL,
+    port INTEGER NOT NULL,
+    seen REAL NOT NULL,
+    sync TEXT NOT NULL,
+    current_block INTEGER,
+    highest_block INTEGER,
+    chain_id INTEGER,
+    network_id TEXT,
+    client_version TEXT,
+    block_number INTEGER,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_endpoint ON observations(ip, port, seen);
+CREATE INDEX IF NOT EXISTS observations_scan ON observations(scan_id);
+CREATE INDEX IF NOT EXISTS observations_chain ON observations(chain_id, seen);
+CREATE INDEX IF NOT EXISTS observations_seen ON observations(seen);
+"""
+
+COLUMNS = ("scan_id", "ip", "port", "seen", "sync", "current_block", "highest_block", "chain_id",
+           "network_id", "client_version", "block_number", "response")
+
+def parse_block(value):
+    """Hex quantity from an eth_syncing result, or None"""
+    try:
+        return int(value, 16) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+def parse_time(value):
+    """Unix time from an ISO date/time or a relative age such as 30m, 24h or 7d"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw])", value.strip())
+    if match:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[match.group(2)]
+        return time.time() - float(match.group(1)) * unit
+    return datetime.fromisoformat(value).timestamp()
+
+def cidr_bounds(cidr):
+    """First and last address of a network as integers, including network and broadcast"""
+    network = ipaddress.IPv4Network(cidr, strict=False)
+    return int(network.network_address), int(network.broadcast_address)
+
+def observation_row(scan_id, node, seen):
+    result = node.get("response", {}).get("result")
+    current = highest = None
+    if isinstance(result, dict):
+        current = parse_block(result.get("currentBlock"))
+        highest = parse_block(result.get("highestBlock"))
+    return (scan_id, ip_to_int(node["ip"]), node["port"], seen, sync_state(node), current, highest,
+            node.get("chain_id"), node.get("network_id"), node.get("client_version"),
+            node.get("block_number"), json.dumps(node.get("response")))
+
+class HistoryStore:
+    def __init__(self, path="scan_history.db", batch_size=5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets queries run while a scan is being written
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def record_scan(self, nodes, started, finished=None, completed=True, source=None):
+        """Store one scan and its nodes; rows are committed batch_size at a time"""
+        finished = finished or time.time()
+        with self.conn:
+            scan_id = self.conn.execute(
+                "INSERT INTO scans (started, finished, completed, source) VALUES (?, ?, ?, ?)",
+                (started, finished, int(completed), source)).lastrowid
+
+        count = 0
+        batch = []
+        for node in nodes:
+            batch.append(observation_row(scan_id, node, finished))
+            if len(batch) >= self.batch_size:
+                count += self._insert(batch)
+                batch = []
+        count += self._insert(batch)
+
+        with self.conn:
+            self.conn.execute("UPDATE scans SET nodes = ? WHERE id = ?", (count, scan_id))
+        return scan_id
+
+    def _insert(self, rows):
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO observations ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows)
+        return len(rows)
+
+    def query(self, cidr=None, port=None, status=None, chain_id=None, since=None, until=None,
+              scan_id=None, min_lag=None, latest=False, limit=None):
+        """Observations matching every given filter, newest first"""
+        where, params = [], []
+        if cidr:
+            where.append("o.ip BETWEEN ? AND ?")
+            params.extend(cidr_bounds(cidr))
+        if port is not None:
+            where.append("o.port = ?")
+            params.append(port)
+        if status:
+            where.append("o.sync = ?")
+            params.append(status)
+        if chain_id is not None:
+            where.append("o.chain_id = ?")
+            params.append(chain_id)
+        if since is not None:
+            where.append("o.seen >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("o.seen <= ?")
+            params.append(until)
+        if scan_id is not None:
+            where.append("o.scan_id = ?")
+            params.append(scan_id)
+        if min_lag is not None:
+            where.append("o.highest_block - o.current_block >= ?")
+            params.append(min_lag)
+        if latest:
+            # Only the newest matching observation of each endpoint
+            where.append("o.seen = (SELECT MAX(seen) FROM observations i WHERE i.ip = o.ip AND i.port = o.port"
+                         + (" AND i.seen >= ?" if since is not None else "")
+                         + (" AND i.seen <= ?" if until is not None else "") + ")")
+            params.extend(value for value in (since, until) if value is not None)
+
+        sql = "SELECT o.* FROM observations o"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY o.seen DESC, o.ip, o.port"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row, ip=int_to_ip(row["ip"]), response=json.loads(row["response"]))
+                for row in self.conn.execute(sql, params)]
+
+    def scans(self, limit=20):
+        return [dict(row) for row in
+                self.conn.execute("SELECT * FROM scans ORDER BY started DESC LIMIT ?", (limit,))]
+
+    def close(self):
+        self.conn.close()
+
+def snapshot_time(path):
+    """Scan time encoded in a result file name, else its modification time"""
+    match = re.search(r"(\d{4}-\d{2}-\d{2})T(\d{2})-(\d{2})-(\d{2})", path)
+    if match:
+        stamp = f"{match.group(1)}T{match.group(2)}:{match.group(3)}:{match.group(4)}"
+        return datetime.fromisoformat(stamp).replace(tzinfo=timezone.utc).timestamp()
+    match = re.search(r"(\d{8}_\d{6})", path)
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+    return os.path.getmtime(path)
+
+def load_result_file(path, port=8545):
+    """(nodes, scan time) from a JSON snapshot, a JSON Lines stream or a nodejs mainnet IP list"""
+    if path.endswith(".jsonl"):
+        return list(read_jsonl(path)), snapshot_time(path)
+    if path.endswith(".txt"):
+        # nodejs/index.js lists IPs it confirmed on chain id 1
+        with open(path, 'r') as f:
+            nodes = [{"ip": line.strip(), "port": port, "chain_id": 1} for line in f if line.strip()]
+        return nodes, snapshot_time(path)
+    with open(path, 'r') as f:
+        data = json.load(f)
+    scan_time = data.get("scan_time")
+    return data.get("nodes", []), (datetime.fromisoformat(scan_time).timestamp() if scan_time
+                                   else snapshot_time(path))
+
+# Used when --history-db is given neither before nor after the subcommand
+DEFAULT_HISTORY_DB = "scan_history.db"
+
+def ingest_command(args):
+    store = HistoryStore(args.history_db or DEFAULT_HISTORY_DB)
+    for path in args.files:
+        nodes, seen = load_result_file(path, args.port)
+        scan_id = store.record_scan(nodes, seen, seen, source=path)
+        print(f"Imported {len(nodes)} node(s) from {path} as scan #{scan_id}")
+    store.close()
+
+def query_command(args):
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+        if args.cidr:
+            cidr_bounds(args.cidr)
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+    store = HistoryStore(args.history_db or DEFAULT_HISTORY_DB)
+    started = time.perf_counter()
+    rows = store.query(cidr=args.cidr, port=args.port, status=args.status, chain_id=args.chain_id,
+                       since=since, until=until, scan_id=args.scan_id, min_lag=args.min_lag,
+                       latest=args.latest, limit=args.limit)
+    elapsed = time.perf_counter() - started
+    store.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    for row in rows:
+        seen = datetime.fromtimestamp(row["seen"]).strftime("%Y-%m-%d %H:%M:%S")
+        line = f"{seen}  {row['ip']}:{row['port']}  {row['sync']}"
+        if row["highest_block"] is not None and row["current_block"] is not None:
+            line += f" ({row['highest_block'] - row['current_block']} blocks behind)"
+        if row["chain_id"] is not None:
+            line += f"  chain {row['chain_id']}"
+        if row["client_version"]:
+            line += f"  {row['client_version']}"
+        print(line)
+    print(f"\n{len(rows)} observation(s) in {elapsed * 1000:.1f} ms")
+
+def add_history_commands(subparsers):
+    """Register the `query` and `ingest` subcommands on an argparse subparsers object"""
+    query = subparsers.add_parser("query", help="Search the scan history database")
+    # SUPPRESS keeps a --history-db given before the subcommand instead of overwriting it with a default
+    query.add_argument("--history-db", default=argparse.SUPPRESS,
+                       help=f"SQLite history database (default: {DEFAULT_HISTORY_DB})")
+    query.add_argument("--cidr", help="Only addresses inside this network (e.g., 10.20.0.0/16)")
+    query.add_argument("--port", type=int, help="Only this port")
+    query.add_argument("--status", choices=["synced", "syncing", "unknown"], help="eth_syncing status")
+    query.add_argument("--min-lag", type=int, help="Only syncing nodes at least this many blocks behind")
+    query.add_argument("--chain-id", type=int, help="Only this chain id (scans run with --fingerprint)")
+    query.add_argument("--since", help="Seen at or after: ISO time or age like 24h, 7d")
+    query.add_argument("--until", help="Seen at or before: ISO time or age like 24h, 7d")
+    query.add_argument("--scan-id", type=int, help="Only this scan")
+    query.add_argument("--latest", action="store_true", help="Only the newest observation of each endpoint")
+    query.add_argument("--limit", type=int, help="Maximum rows")
+    query.add_argument("--json", action="store_true", help="Print rows as JSON")
+    query.set_defaults(func=query_command)
+
+    ingest = subparsers.add_parser("ingest", help="Import existing result files into the history database")
+    ingest.add_argument("files", nargs="+", help="JSON snapshots, .jsonl streams or nodejs mainnet_nodes_*.txt")
+    ingest.add_argument("--history-db", default=argparse.SUPPRESS,
+                        help=f"SQLite history database (default: {DEFAULT_HISTORY_DB})")
+    ingest.add_argument("--port", type=int, default=8545, help="Port recorded for .txt IP lists")
+    ingest.set_defaults(func=ingest_command)
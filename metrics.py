@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Live scan metrics
+Per-thread counters and latency histograms recorded without locks, served in Prometheus text format
+"""
+
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class ThreadLocalShards:
+    """Each thread writes only its own shard, so recording never takes a lock; readers merge shards
+
+    `new_shard` builds the empty shard a thread starts from.
+    """
+
+    def __init__(self, new_shard):
+        self.new_shard = new_shard
+        self.local = threading.local()
+        self.shards = []
+        # Only taken when a thread records for the first time and when reading
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = self.new_shard()
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def copies(self):
+        """Copy every shard; a copy is atomic under the GIL, so writers are never blocked"""
+        with self.lock:
+            return [shard.copy() for shard in self.shards]
+
+class ThreadLocalCounters(ThreadLocalShards):
+    def __init__(self):
+        super().__init__(dict)
+
+    def add(self, key, amount=1):
+        shard = self.shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def totals(self):
+        totals = {}
+        for shard in self.copies():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+class Histogram(ThreadLocalShards):
+    """Bucket counts followed by the running sum of observed values"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        super().__init__(lambda: [0] * (len(bounds) + 1) + [0.0])
+        self.bounds = bounds
+
+    def observe(self, value):
+        shard = self.shard()
+        shard[bisect.bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def totals(self):
+        totals = self.new_shard()
+        for shard in self.copies():
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+def merge_counts(*dicts):
+    merged = {}
+    for counts in dicts:
+        for key, value in counts.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+def format_metric(name, kind, help_text, samples):
+    """Prometheus text lines for one metric; samples are (suffix, labels, value)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text
+                     else f"{name}{suffix} {value}")
+    return lines
+
+def histogram_samples(bounds, totals):
+    """Cumulative `le` buckets, sum and count of a merged histogram"""
+    samples = []
+    cumulative = 0
+    for bound, count in zip(bounds, totals):
+        cumulative += count
+        samples.append(("_bucket", {"le": f"{bound:g}"}, cumulative))
+    cumulative += totals[len(bounds)]
+    samples.append(("_bucket", {"le": "+Inf"}, cumulative))
+    samples.append(("_sum", {}, totals[-1]))
+    samples.append(("_count", {}, cumulative))
+    return samples
+
+class ScanMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.counters = ThreadLocalCounters()
+        self.latency = {"connect": Histogram(), "response": Histogram()}
+        # Size of the target space and addresses a resumed checkpoint had already covered
+        self.target_hosts = 0
+        self.done_before = 0
+        # Latest snapshot from each shard process, keyed by shard number
+        self.remote = {}
+
+    def host_done(self):
+        self.counters.add("hosts")
+
+    def observe(self, kind, seconds):
+        self.latency[kind].observe(seconds)
+
+    def snapshot(self, controller):
+        """Picklable totals of this process, sent from shard processes to the parent"""
+        return {
+            "counters": self.counters.totals(),
+            "latency": {kind: histogram.totals() for kind, histogram in self.latency.items()},
+            "outcomes": controller.outcomes,
+            "local_errors": dict(controller.local_errors),
+            "inflight": controller.inflight,
+            "limit": controller.limit,
+        }
+
+    def render(self, controller, nodes_found):
+        """Prometheus text exposition of this process and every shard that reported"""
+        local = self.snapshot(controller)
+        if self.remote:
+            # The parent of shard processes does not probe itself
+            local.update(inflight=0, limit=0)
+        snapshots = [local] + list(self.remote.values())
+        counters = merge_counts(*(s["counters"] for s in snapshots))
+        outcomes = merge_counts(*(s.get("outcomes", {}) for s in snapshots))
+        local_errors = merge_counts(*(s.get("local_errors", {}) for s in snapshots))
+        hosts = counters.get("hosts", 0)
+        done = self.done_before + hosts
+
+        lines = []
+        lines += format_metric("eth_scanner_start_time_seconds", "gauge",
+                               "Unix time the scan started", [("", {}, self.started)])
+        lines += format_metric("eth_scanner_target_hosts", "gauge",
+                               "Addresses in the target space", [("", {}, self.target_hosts)])
+        lines += format_metric("eth_scanner_hosts_scanned_total", "counter",
+                               "Addresses probed by this run", [("", {}, hosts)])
+        lines += format_metric("eth_scanner_progress_ratio", "gauge",
+                               "Fraction of the target space done, including resumed checkpoints",
+                               [("", {}, min(1.0, done / self.target_hosts) if self.target_hosts else 0)])
+        lines += format_metric("eth_scanner_probes_total", "counter", "Probe outcomes",
+                               [("", {"outcome": name}, count) for name, count in sorted(outcomes.items())])
+        lines += format_metric("eth_scanner_local_errors_total", "counter",
+                               "Local resource errors by errno",
+                               [("", {"errno": name}, count) for name, count in sorted(local_errors.items())])
+        lines += format_metric("eth_scanner_nodes_found", "gauge", "Ethereum nodes found so far",
+                               [("", {}, nodes_found)])
+        lines += format_metric("eth_scanner_inflight_probes", "gauge", "Probes currently in flight",
+                               [("", {}, sum(s.get("inflight", 0) for s in snapshots))])
+        lines += format_metric("eth_scanner_concurrency_limit", "gauge", "Current in-flight probe limit",
+                               [("", {}, sum(s.get("limit", 0) for s in snapshots))])
+        for kind, histogram in self.latency.items():
+            totals = [sum(values) for values in zip(*(s["latency"][kind] for s in snapshots))]
+            lines += format_metric(f"eth_scanner_{kind}_seconds", "histogram",
+                                   f"Time to {kind} on probes that got an answer",
+                                   histogram_samples(histogram.bounds, totals))
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves `render()` on /metrics from a daemon thread"""
+
+    def __init__(self, render, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server",
+                                       daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,56 +1,213 @@
 #!/usr/bin/env python3
 """
 Monitor script to check scan progress and results
+Follows the scanner's JSON Lines stream, reading only new bytes as they are appended
 """
 
 import os
 import json
 import time
-import glob
+import select
+import ctypes
+import ctypes.util
+import argparse
+from collections import deque
 from datetime import datetime
 
-def monitor_scan():
-    print("🔍 Ethereum Node Scanner Monitor")
-    print("=" * 50)
-    
-    while True:
-        # Check for result files
-        result_files = glob.glob("ethereum_nodes_*.json")
-        
-        if result_files:
-            # Get the latest file
-            latest_file = max(result_files, key=os.path.getctime)
-            
+from endpoint_cache import int_to_ip, sync_state
+from scan_state import ip_to_int
+
+# inotify event masks from <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+
+class InotifyWatcher:
+    """Wakes up when a file in a directory is written, created or replaced"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the directory, not the file, so a new or replaced stream file is noticed too
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Block until something changed or the timeout passed"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
             try:
-                with open(latest_file, 'r') as f:
-                    data = json.load(f)
-                
-                print(f"\n📊 Latest Results from: {latest_file}")
-                print(f"⏰ Scan Time: {data.get('scan_time', 'Unknown')}")
-                print(f"🎯 Total Nodes Found: {data.get('total_nodes_found', 0)}")
-                
-                if data.get('nodes'):
-                    print(f"\n🌐 Found Ethereum Nodes:")
-                    for i, node in enumerate(data['nodes'][:10], 1):  # Show first 10
-                        syncing = node['response'].get('result', 'unknown')
-                        print(f"  {i:2d}. {node['ip']}:{node['port']} - Syncing: {syncing}")
-                    
-                    if len(data['nodes']) > 10:
-                        print(f"  ... and {len(data['nodes']) - 10} more nodes")
-                
-            except Exception as e:
-                print(f"Error reading results: {e}")
-        else:
-            print("⏳ No scan results found yet...")
-        
-        print(f"\n🔄 Last checked: {datetime.now().strftime('%H:%M:%S')}")
-        print("Press Ctrl+C to stop monitoring")
-        
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Fallback where inotify is unavailable: re-check the file size at a short interval"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+    def close(self):
+        pass
+
+def make_watcher(directory, poll=False):
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            # Not Linux, no libc symbol, or the directory does not exist yet
+            pass
+    return PollingWatcher()
+
+class StreamTail:
+    """Reads records appended to a JSON Lines file since the previous call"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.inode = None
+        self.buffer = b""
+
+    def read_new(self):
+        """Return (new records, whether the file was replaced or truncated since the last read)"""
         try:
-            time.sleep(30)  # Check every 30 seconds
-        except KeyboardInterrupt:
-            print("\n👋 Monitoring stopped")
-            break
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return [], False
+
+        reset = False
+        if self.file is None or st.st_ino != self.inode or st.st_size < self.file.tell():
+            # A new scan replaced or truncated the stream: start over from its first byte
+            reset = self.file is not None
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.filename, 'rb')
+            self.inode = st.st_ino
+            self.buffer = b""
+
+        data = self.file.read()
+        if not data:
+            return [], reset
+        lines = (self.buffer + data).split(b"\n")
+        # The last piece is a line still being written
+        self.buffer = lines.pop()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records, reset
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+class ScanAggregates:
+    """Running totals over every node seen in the stream"""
+
+    def __init__(self, recent=10):
+        self.total = 0
+        self.sync = {}
+        # /16 prefix -> nodes found in it
+        self.ranges = {}
+        self.chains = {}
+        self.recent = deque(maxlen=recent)
+
+    def add(self, node):
+        self.total += 1
+        state = sync_state(node)
+        self.sync[state] = self.sync.get(state, 0) + 1
+        block = ip_to_int(node["ip"]) >> 16
+        self.ranges[block] = self.ranges.get(block, 0) + 1
+        if node.get("chain_id") is not None:
+            self.chains[node["chain_id"]] = self.chains.get(node["chain_id"], 0) + 1
+        self.recent.append(node)
+
+    def top_ranges(self, count=5):
+        ranked = sorted(self.ranges.items(), key=lambda item: item[1], reverse=True)[:count]
+        return [(f"{int_to_ip(block << 16)}/16", hits) for block, hits in ranked]
+
+def print_node(node):
+    syncing = node.get('response', {}).get('result', 'unknown')
+    print(f"🆕 {node['ip']}:{node['port']} - Syncing: {syncing}")
+
+def print_summary(stats, stream_file):
+    if not stats.total and not os.path.exists(stream_file):
+        print(f"\n⏳ No scan results found yet ({stream_file})...")
+    else:
+        print(f"\n📊 Results from: {stream_file}")
+        print(f"🎯 Total Nodes Found: {stats.total}")
+        if stats.total:
+            print("🔄 Sync status: " + ", ".join(f"{name}={count}" for name, count in sorted(stats.sync.items())))
+            print("🗺️  Top /16 ranges: " + ", ".join(f"{block} ({hits})" for block, hits in stats.top_ranges()))
+            if stats.chains:
+                print("⛓️  Chains: " + ", ".join(f"{chain_id}={count}" for chain_id, count in sorted(stats.chains.items())))
+            print(f"\n🌐 Latest Ethereum Nodes:")
+            for i, node in enumerate(stats.recent, 1):
+                syncing = node.get('response', {}).get('result', 'unknown')
+                print(f"  {i:2d}. {node['ip']}:{node['port']} - Syncing: {syncing}")
+
+    print(f"\n🔄 Last checked: {datetime.now().strftime('%H:%M:%S')}")
+    print("Press Ctrl+C to stop monitoring")
+
+def monitor_scan(stream_file="ethereum_nodes_current.jsonl", summary_interval=30, poll=False):
+    print("🔍 Ethereum Node Scanner Monitor")
+    print("=" * 50)
+
+    watcher = make_watcher(os.path.dirname(os.path.abspath(stream_file)), poll)
+    print(f"Following {stream_file} ({'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'})")
+    tail = StreamTail(stream_file)
+    stats = ScanAggregates()
+    # Nodes already in the file when the monitor starts are only summarized
+    announce = False
+    last_summary = None
+
+    try:
+        while True:
+            records, reset = tail.read_new()
+            if reset:
+                print("\n♻️  Stream file was replaced, starting over")
+                stats = ScanAggregates()
+            for node in records:
+                stats.add(node)
+                if announce:
+                    print_node(node)
+            announce = True
+
+            now = time.monotonic()
+            if last_summary is None or now - last_summary >= summary_interval:
+                print_summary(stats, stream_file)
+                last_summary = now
+            watcher.wait(max(0, summary_interval - (time.monotonic() - last_summary)))
+    except KeyboardInterrupt:
+        print("\n👋 Monitoring stopped")
+    finally:
+        tail.close()
+        watcher.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow a running scan's JSON Lines results")
+    parser.add_argument("--stream-file", default="ethereum_nodes_current.jsonl",
+                        help="JSON Lines file written by ethereum_node_scanner.py --stream-file")
+    parser.add_argument("--summary-interval", type=float, default=30,
+                        help="Seconds between summaries; new nodes are printed as soon as they appear")
+    parser.add_argument("--poll", action="store_true", help="Poll the file instead of using inotify")
+    args = parser.parse_args()
+    monitor_scan(args.stream_file, args.summary_interval, args.poll)
 
 if __name__ == "__main__":
-    monitor_scan()
+    main()
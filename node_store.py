@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Deduplicated in-memory store of discovered nodes
+Records are __slots__ objects indexed by a packed (ip << 16 | port) integer
+"""
+
+from scan_state import ip_to_int
+from endpoint_cache import int_to_ip
+
+FINGERPRINT_FIELDS = ("chain_id", "network_id", "client_version", "block_number")
+
+def endpoint_index(ip, port):
+    """Pack an IPv4 address and port into one integer key"""
+    return (ip_to_int(ip) << 16) | port
+
+class NodeRecord:
+    __slots__ = ("ip_int", "port", "status", "result", "response") + FINGERPRINT_FIELDS
+
+    def __init__(self, node_info):
+        self.ip_int = ip_to_int(node_info["ip"])
+        self.port = node_info["port"]
+        self.status = node_info.get("status", "active")
+        response = node_info.get("response") or {}
+        self.result = response.get("result")
+        # Only replies that differ from the plain eth_syncing shape keep their whole body
+        plain = (response.keys() == {"jsonrpc", "id", "result"} and response["jsonrpc"] == "2.0"
+                 and type(response["id"]) is int and response["id"] == 1)
+        self.response = None if plain else response
+        for field in FINGERPRINT_FIELDS:
+            setattr(self, field, node_info.get(field))
+
+    def to_dict(self):
+        """The record in the scanner's JSON result format"""
+        node_info = {
+            "ip": int_to_ip(self.ip_int),
+            "port": self.port,
+            "response": self.response if self.response is not None else
+                        {"jsonrpc": "2.0", "id": 1, "result": self.result},
+            "status": self.status,
+        }
+        for field in FINGERPRINT_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                node_info[field] = value
+        return node_info
+
+class NodeStore:
+    """Nodes in discovery order, at most one per (ip, port); iterates as result dicts"""
+
+    def __init__(self):
+        self.records = {}
+
+    def add(self, node_info):
+        """Store a node; returns False if the endpoint was already found"""
+        record = NodeRecord(node_info)
+        # setdefault is a single atomic dict operation, so concurrent inserts need no lock
+        return self.records.setdefault((record.ip_int << 16) | record.port, record) is record
+
+    def append(self, node_info):
+        self.add(node_info)
+
+    def extend(self, nodes):
+        for node_info in nodes:
+            self.add(node_info)
+
+    def __contains__(self, endpoint):
+        ip, port = endpoint
+        return endpoint_index(ip, port) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for record in list(self.records.values()):
+            yield record.to_dict()
@@ -94,7 +94,16 @@ async function checkAllNodes() {
     for (let i = 0; i < nodesData.nodes.length; i++) {
         const node = nodesData.nodes[i];
 
-        const result = await checkChainId(node.ip, node.port);
+        // Scans run with --fingerprint already carry the chain id, no second round trip needed
+        const result = typeof node.chain_id === 'number'
+            ? {
+                ip: node.ip,
+                port: node.port,
+                chainId: '0x' + node.chain_id.toString(16),
+                isMainnet: node.chain_id === 1,
+                success: true
+            }
+            : await checkChainId(node.ip, node.port);
 
         if (result.isMainnet) {
             // Log IP immediately to file
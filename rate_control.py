@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Probe rate and concurrency control
+Caps connection attempts per second, sizes concurrency from local resource limits and
+backs off when the scan host itself runs out of file descriptors or ephemeral ports
+"""
+
+import time
+import errno
+import asyncio
+import resource
+import threading
+from collections import deque
+
+from metrics import ThreadLocalCounters
+
+# Failures caused by the scanning host, not by the target
+LOCAL_ERRORS = {
+    errno.EMFILE,
+    errno.ENFILE,
+    errno.EADDRNOTAVAIL,
+    errno.EADDRINUSE,
+    errno.ENOBUFS,
+    errno.ENOMEM,
+}
+
+# File descriptors kept free for logs, result files and the state bitmap
+FD_RESERVE = 64
+
+class LocalResourceError(OSError):
+    """A probe failed because of a local resource limit; the target was not tested"""
+
+def classify_errno(code):
+    """Map a connect errno to a probe outcome"""
+    if code == 0:
+        return "open"
+    if code == errno.ECONNREFUSED:
+        return "closed"
+    if code in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ETIMEDOUT, errno.EINPROGRESS):
+        return "timeout"
+    if code in LOCAL_ERRORS:
+        return "local_error"
+    return "unreachable"
+
+def fd_limit():
+    """Soft RLIMIT_NOFILE of this process"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return soft if soft != resource.RLIM_INFINITY else 1 << 20
+
+def ephemeral_port_count():
+    """Size of the kernel's ephemeral port range"""
+    try:
+        with open("/proc/sys/net/ipv4/ip_local_port_range") as f:
+            low, high = map(int, f.read().split())
+        return high - low + 1
+    except (OSError, ValueError):
+        # Linux default range 32768-60999
+        return 28232
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        """Take tokens and return how long the caller must wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= cost
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+class ConcurrencyController:
+    def __init__(self, requested, sockets_per_probe=1, rate=None, share=1,
+                 backoff_cooldown=1.0):
+        self.sockets_per_probe = sockets_per_probe
+        self.fd_limit = fd_limit()
+        # The ephemeral range is shared with the other scan processes on this host
+        self.ephemeral_ports = ephemeral_port_count() // share
+        self.requested = requested
+        self.max_limit = max(1, min(
+            requested,
+            (self.fd_limit - FD_RESERVE) // sockets_per_probe,
+            self.ephemeral_ports // sockets_per_probe,
+        ))
+        self.min_limit = max(1, min(16, self.max_limit))
+        self.limit = self.max_limit
+        self.bucket = TokenBucket(rate / share) if rate else None
+        self.backoff_cooldown = backoff_cooldown
+        self.last_backoff = 0
+        self.successes = 0
+        self.inflight = 0
+        # Per-thread counts, so recording an outcome never takes the condition lock
+        self.outcome_counts = ThreadLocalCounters()
+        self.local_errors = {}
+        self.condition = threading.Condition()
+        # Futures of coroutines parked in acquire_async; only touched from the event loop thread
+        self.waiters = deque()
+
+    def describe(self):
+        return (f"requested {self.requested}, fd limit {self.fd_limit}, "
+                f"ephemeral ports {self.ephemeral_ports} -> {self.max_limit} probes in flight")
+
+    def acquire(self):
+        """Block until a probe may start"""
+        with self.condition:
+            while self.inflight >= self.limit:
+                self.condition.wait()
+            self.inflight += 1
+        if self.bucket is not None:
+            delay = self.bucket.reserve(self.sockets_per_probe)
+            if delay:
+                time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait on the event loop until a probe may start"""
+        while self.inflight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            await waiter
+        self.inflight += 1
+        if self.bucket is not None:
+            delay = self.bucket.reserve(self.sockets_per_probe)
+            if delay:
+                await asyncio.sleep(delay)
+
+    def release(self):
+        """A probe finished; grow the limit again after a round of clean probes"""
+        with self.condition:
+            self.inflight -= 1
+            self.successes += 1
+            if self.limit < self.max_limit and self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+            self.condition.notify()
+            self.wake_waiters()
+
+    def yield_slot(self):
+        """Give up a slot without counting a clean probe, e.g. while waiting to retry"""
+        with self.condition:
+            self.inflight -= 1
+            self.condition.notify()
+            self.wake_waiters()
+
+    def wake_waiters(self):
+        """Wake as many parked coroutines as there are free slots; each re-checks the limit"""
+        free = self.limit - self.inflight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @property
+    def outcomes(self):
+        """Probe outcome totals across all threads"""
+        return self.outcome_counts.totals()
+
+    def record(self, outcome, count=1):
+        """Count a probe outcome"""
+        self.outcome_counts.add(outcome, count)
+
+    def backoff(self, error):
+        """Halve the in-flight limit after a local resource error"""
+        name = errno.errorcode.get(error.errno, str(error.errno))
+        with self.condition:
+            self.local_errors[name] = self.local_errors.get(name, 0) + 1
+            now = time.monotonic()
+            if now - self.last_backoff >= self.backoff_cooldown:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.successes = 0
+                self.last_backoff = now
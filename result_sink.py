@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Append-only JSON Lines result sink
+Writes one line per discovered node from a background thread so scan workers never wait on disk I/O
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+
+_STOP = object()
+
+def read_jsonl(filename):
+    """Yield records from a JSON Lines file, skipping a torn last line"""
+    with open(filename, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+class JsonlResultSink:
+    def __init__(self, filename="ethereum_nodes_current.jsonl", flush_interval=1.0, flush_every=100,
+                 append=False):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.append = append
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self.thread.start()
+    
+    def write(self, node_info):
+        """Queue a node record; never blocks on the file"""
+        self.queue.put(node_info)
+    
+    def close(self):
+        """Write out everything queued, fsync and stop the writer thread"""
+        self.queue.put(_STOP)
+        self.thread.join()
+    
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+    
+    def _run(self):
+        with open(self.filename, 'a' if self.append else 'w') as f:
+            pending = 0
+            last_sync = time.monotonic()
+            while True:
+                wait = self.flush_interval - (time.monotonic() - last_sync) if pending else None
+                try:
+                    item = self.queue.get(timeout=max(wait, 0) if wait is not None else None)
+                except queue.Empty:
+                    item = None
+                
+                if item is _STOP:
+                    break
+                if item is not None:
+                    try:
+                        f.write(json.dumps(item) + "\n")
+                        pending += 1
+                        if self.queue.empty():
+                            # Hand the burst to the kernel so tailing readers see it now; fsync stays batched
+                            f.flush()
+                    except Exception as e:
+                        print(f"  ❌ Error writing result: {e}")
+                
+                # Batch fsyncs by count or by time since the last one
+                if pending and (pending >= self.flush_every or
+                                time.monotonic() - last_sync >= self.flush_interval):
+                    self._sync(f)
+                    pending = 0
+                    last_sync = time.monotonic()
+            
+            self._sync(f)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Checkpoint state for long sweeps
+Keeps one bit per target address in a memory-mapped file so an interrupted scan can resume
+"""
+
+import os
+import mmap
+import time
+import socket
+import bisect
+import hashlib
+import ipaddress
+import threading
+
+MAGIC = b"ETHSCAN1"
+HEADER_SIZE = 64
+
+def ip_to_int(ip):
+    """Convert a dotted IPv4 string to an integer"""
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+def network_interval(network):
+    """Return the first and last host address of an IPv4 network as integers, matching hosts()"""
+    # IPv4 only: an IPv6 network would otherwise map onto unrelated IPv4 addresses
+    if ":" in str(network):
+        raise ValueError(f"invalid network {network!r}: only IPv4 targets are supported")
+    network_obj = ipaddress.IPv4Network(network, strict=False)
+    first, last = int(network_obj.network_address), int(network_obj.broadcast_address)
+    if network_obj.prefixlen < 31:
+        # Network and broadcast addresses are not hosts
+        return first + 1, last - 1
+    return first, last
+
+def range_interval(start_ip, end_ip):
+    """Return an inclusive start/end IPv4 range as integers"""
+    if ":" in f"{start_ip}{end_ip}":
+        raise ValueError(f"invalid range {start_ip} - {end_ip}: only IPv4 targets are supported")
+    return int(ipaddress.IPv4Address(start_ip)), int(ipaddress.IPv4Address(end_ip))
+
+def merge_intervals(intervals):
+    """Sort inclusive integer intervals and merge those that overlap or touch"""
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [(first, last) for first, last in merged]
+
+class ScanState:
+    def __init__(self, path, intervals, resume=False, flush_interval=10):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+        # Each interval starts on a byte boundary, aligned to a multiple of 8 addresses,
+        # so blocks of addresses never share a byte with another interval
+        self.starts = []
+        self.ends = []
+        self.offsets = []
+        size = 0
+        for first, last in merge_intervals(intervals):
+            base = first & ~7
+            self.starts.append(base)
+            self.ends.append(last)
+            self.offsets.append(size * 8)
+            size += (last - base) // 8 + 1
+
+        digest = hashlib.sha256(repr(merge_intervals(intervals)).encode()).digest()
+        header = MAGIC + digest
+        header += b"\0" * (HEADER_SIZE - len(header))
+
+        self.resumed = False
+        if resume and os.path.exists(path):
+            # Check the header before the size, so a checkpoint for other targets is always reported
+            with open(path, 'rb') as f:
+                saved_header = f.read(HEADER_SIZE)
+            if saved_header != header:
+                print(f"⚠️  State file {path} belongs to a different target set, starting over")
+            elif os.path.getsize(path) != HEADER_SIZE + size:
+                print(f"⚠️  State file {path} is truncated or corrupt, starting over")
+            else:
+                self.resumed = True
+
+        if not self.resumed:
+            with open(path, 'wb') as f:
+                f.write(header)
+                f.truncate(HEADER_SIZE + size)
+
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def _bit(self, ip_int):
+        """Locate the bit for an address, or None if it is outside the target set"""
+        i = bisect.bisect_right(self.starts, ip_int) - 1
+        if i < 0 or ip_int > self.ends[i]:
+            return None
+        return self.offsets[i] + ip_int - self.starts[i]
+
+    def is_done(self, ip_int):
+        """Return True if the address was already scanned"""
+        bit = self._bit(ip_int)
+        if bit is None:
+            return False
+        return bool(self.map[HEADER_SIZE + (bit >> 3)] & (1 << (bit & 7)))
+
+    def mark(self, ip_int):
+        """Record an address as scanned and flush if the interval has passed"""
+        bit = self._bit(ip_int)
+        if bit is None:
+            return
+        with self.lock:
+            self.map[HEADER_SIZE + (bit >> 3)] |= 1 << (bit & 7)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.map.flush()
+                self.last_flush = time.monotonic()
+
+    def count_done(self):
+        """Count scanned addresses"""
+        return int.from_bytes(self.map[HEADER_SIZE:], "big").bit_count()
+
+    def close(self):
+        """Flush and release the bitmap"""
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Target sets as merged integer intervals
+Parses CIDRs, ranges and single addresses (from the command line or files), subtracts excludes
+and yields addresses as plain integers
+"""
+
+import bisect
+import ipaddress
+
+from scan_state import network_interval, range_interval, merge_intervals
+
+def parse_target(spec, hosts_only=True):
+    """Parse "10.0.0.0/8", "10.0.0.1-10.0.0.99" or "10.0.0.1" into an inclusive integer interval
+
+    With hosts_only, a network excludes its network and broadcast addresses like hosts() does;
+    excludes pass hosts_only=False so the whole block is removed.
+    """
+    spec = spec.strip()
+    if ":" in spec:
+        raise ValueError(f"invalid target {spec!r}: only IPv4 targets are supported")
+    try:
+        if "/" in spec:
+            if hosts_only:
+                return network_interval(spec)
+            network = ipaddress.ip_network(spec, strict=False)
+            return int(network.network_address), int(network.broadcast_address)
+        if "-" in spec:
+            start, end = (part.strip() for part in spec.split("-", 1))
+            first, last = range_interval(start, end)
+            if first > last:
+                raise ValueError("range starts after it ends")
+            return first, last
+        address = int(ipaddress.ip_address(spec))
+        return address, address
+    except ValueError as e:
+        raise ValueError(f"invalid target {spec!r}: {e}")
+
+def read_target_file(path):
+    """Target specs from a file: one or more per line, separated by spaces or commas; # starts a comment"""
+    specs = []
+    with open(path, 'r') as f:
+        for line in f:
+            specs.extend(line.split("#", 1)[0].replace(",", " ").split())
+    return specs
+
+def subtract_intervals(intervals, excludes):
+    """Remove merged `excludes` from merged `intervals`"""
+    result = []
+    i = 0
+    for first, last in intervals:
+        # Skip excludes that end before this interval
+        while i < len(excludes) and excludes[i][1] < first:
+            i += 1
+        j = i
+        while j < len(excludes) and excludes[j][0] <= last:
+            if excludes[j][0] > first:
+                result.append((first, excludes[j][0] - 1))
+            first = max(first, excludes[j][1] + 1)
+            j += 1
+        if first <= last:
+            result.append((first, last))
+    return result
+
+def iter_intervals(intervals, shard=0, shards=1):
+    """Yield addresses of integer intervals, keeping only one shard's /24 blocks
+
+    Blocks of 256 addresses are dealt round-robin, so every shard gets an even,
+    interleaved slice of each range.
+    """
+    if shards == 1:
+        for first, last in intervals:
+            yield from range(first, last + 1)
+        return
+    for first, last in intervals:
+        for block in range(first >> 8, (last >> 8) + 1):
+            if block % shards != shard:
+                continue
+            yield from range(max(first, block << 8), min(last, (block << 8) | 0xff) + 1)
+
+def chunk_intervals(intervals, size):
+    """Yield consecutive pieces of at most `size` addresses, each a list of intervals"""
+    chunk, room = [], size
+    for first, last in intervals:
+        while first <= last:
+            end = min(last, first + room - 1)
+            chunk.append((first, end))
+            room -= end - first + 1
+            first = end + 1
+            if not room:
+                yield chunk
+                chunk, room = [], size
+    if chunk:
+        yield chunk
+
+class TargetSet:
+    """Merged, non-overlapping address intervals minus the excluded ones"""
+
+    def __init__(self, intervals=(), excludes=()):
+        self.excludes = merge_intervals(excludes)
+        self.intervals = subtract_intervals(merge_intervals(intervals), self.excludes)
+        self.starts = [first for first, _ in self.intervals]
+
+    @classmethod
+    def parse(cls, specs=(), exclude_specs=(), files=(), exclude_files=(), intervals=()):
+        """Build a target set from CLI specs and files, plus already parsed intervals"""
+        specs = list(specs)
+        exclude_specs = list(exclude_specs)
+        for path in files:
+            specs.extend(read_target_file(path))
+        for path in exclude_files:
+            exclude_specs.extend(read_target_file(path))
+        return cls(list(intervals) + [parse_target(spec) for spec in specs],
+                   [parse_target(spec, hosts_only=False) for spec in exclude_specs])
+
+    def __len__(self):
+        return sum(last - first + 1 for first, last in self.intervals)
+
+    def __iter__(self):
+        return iter_intervals(self.intervals)
+
+    def __contains__(self, ip_int):
+        i = bisect.bisect_right(self.starts, ip_int) - 1
+        return i >= 0 and ip_int <= self.intervals[i][1]
+
+    def shard(self, shard, shards):
+        return iter_intervals(self.intervals, shard, shards)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Watch mode
+Keeps polling known endpoints for eth_syncing and eth_blockNumber over pooled keep-alive
+connections and reports when a node starts syncing, stalls, goes down or comes back
+"""
+
+import json
+import heapq
+import random
+import asyncio
+import argparse
+from collections import OrderedDict
+from datetime import datetime
+
+from ethereum_node_scanner import (build_request_tail, build_rpc_request, read_http_response,
+                                   response_complete, parse_http_json, is_rpc_reply,
+                                   index_replies, parse_hex_quantity)
+from endpoint_cache import sync_state
+from history_store import load_result_file
+from result_sink import JsonlResultSink
+
+WATCH_METHODS = ["eth_syncing", "eth_blockNumber"]
+
+WATCH_REQUEST_TAIL = build_request_tail(json.dumps([
+    {"jsonrpc": "2.0", "method": method, "params": [], "id": i}
+    for i, method in enumerate(WATCH_METHODS, 1)
+]).encode(), connection=b"keep-alive")
+
+# For servers that reject batches
+SYNCING_REQUEST_TAIL = build_request_tail(json.dumps(
+    {"jsonrpc": "2.0", "method": "eth_syncing", "params": [], "id": 1}
+).encode(), connection=b"keep-alive")
+
+def keeps_alive(raw):
+    """True if the connection can carry another request after this response"""
+    if not response_complete(raw):
+        # The body ran until the server closed the connection
+        return False
+    head = raw.partition(b"\r\n\r\n")[0].lower()
+    if b"connection: close" in head:
+        return False
+    return not head.startswith(b"http/1.0") or b"connection: keep-alive" in head
+
+def parse_watch_response(raw):
+    """(sync status, block number) from a reply to the watch batch or a lone eth_syncing, or None"""
+    data = parse_http_json(raw)
+    if is_rpc_reply(data):
+        if data["id"] == 1 and "result" in data:
+            return sync_state({"response": data}), None
+        return None
+    if not isinstance(data, list):
+        return None
+    replies = index_replies(data)
+    syncing = replies.get(1)
+    if syncing is None or "result" not in syncing:
+        return None
+    return sync_state({"response": syncing}), parse_hex_quantity(replies.get(2, {}).get("result"))
+
+class ConnectionPool:
+    """Idle keep-alive connections per endpoint, with at most `size` sockets open in total"""
+
+    def __init__(self, size=256, timeout=5):
+        self.size = size
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(size)
+        # endpoint -> (reader, writer), least recently used first
+        self.idle = OrderedDict()
+        self.open = 0
+        self.opened = 0
+        self.reused = 0
+
+    def _close(self, conn):
+        conn[1].close()
+        self.open -= 1
+
+    def _make_room(self):
+        """Close the least recently used idle connection when the pool is full"""
+        while self.open >= self.size and self.idle:
+            self._close(self.idle.popitem(last=False)[1])
+
+    async def _connect(self, endpoint):
+        self._make_room()
+        conn = await asyncio.wait_for(asyncio.open_connection(*endpoint), self.timeout)
+        self.open += 1
+        self.opened += 1
+        return conn
+
+    async def request(self, endpoint, request):
+        """Send one request and return the raw response, reusing an idle connection when there is one"""
+        async with self.slots:
+            conn = self.idle.pop(endpoint, None)
+            reused = conn is not None
+            if conn is None:
+                conn = await self._connect(endpoint)
+            while True:
+                try:
+                    conn[1].write(request)
+                    raw = await asyncio.wait_for(read_http_response(conn[0]), self.timeout)
+                    if not raw:
+                        raise ConnectionResetError("no usable response (closed, oversize or not JSON)")
+                    break
+                except (OSError, asyncio.TimeoutError):
+                    self._close(conn)
+                    if not reused:
+                        raise
+                    # The server dropped the idle connection; one fresh attempt
+                    reused = False
+                    conn = await self._connect(endpoint)
+            if reused:
+                self.reused += 1
+            if keeps_alive(raw):
+                self.idle[endpoint] = conn
+            else:
+                self._close(conn)
+            return raw
+
+    def close(self):
+        while self.idle:
+            self._close(self.idle.popitem()[1])
+
+class EndpointState:
+    __slots__ = ("status", "block", "failures", "stalled_polls", "batch", "polls", "request")
+
+    def __init__(self, ip, port, status):
+        self.status = status
+        self.block = None
+        self.failures = 0
+        self.stalled_polls = 0
+        self.batch = True
+        self.polls = 0
+        self.request = build_rpc_request(ip, port, WATCH_REQUEST_TAIL)
+
+class EndpointWatcher:
+    def __init__(self, nodes, interval=60, jitter=0.1, max_connections=256, timeout=5,
+                 down_after=2, stall_after=3, sink=None):
+        self.interval = interval
+        self.jitter = jitter
+        self.down_after = down_after
+        self.stall_after = stall_after
+        self.sink = sink
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.pool = None
+        # Start from the status recorded in the results file, so the first poll already reports changes
+        self.states = {(node["ip"], node["port"]): EndpointState(node["ip"], node["port"], sync_state(node))
+                       for node in nodes}
+        self.events = 0
+
+    def emit(self, endpoint, state, status, detail=None):
+        """Report a status change"""
+        event = {
+            "time": datetime.now().isoformat(),
+            "ip": endpoint[0],
+            "port": endpoint[1],
+            "before": state.status,
+            "after": status,
+            "block_number": state.block,
+        }
+        if detail:
+            event["detail"] = detail
+        state.status = status
+        self.events += 1
+        icon = {"down": "🔴", "stalled": "🟠", "syncing": "🟡", "synced": "🟢"}.get(status, "⚪")
+        print(f"{icon} {endpoint[0]}:{endpoint[1]} {event['before']} -> {status}"
+              + (f" (block {state.block})" if state.block is not None else "")
+              + (f" - {detail}" if detail else ""))
+        if self.sink is not None:
+            self.sink.write(event)
+
+    async def poll(self, endpoint, state):
+        state.polls += 1
+        try:
+            raw = await self.pool.request(endpoint, state.request)
+            parsed = parse_watch_response(raw)
+            if parsed is None and state.batch:
+                # Not a batch reply; fall back to a lone eth_syncing from now on
+                state.batch = False
+                state.request = build_rpc_request(endpoint[0], endpoint[1], SYNCING_REQUEST_TAIL)
+                parsed = parse_watch_response(await self.pool.request(endpoint, state.request))
+            if parsed is None:
+                raise ValueError("not a JSON-RPC reply")
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            state.failures += 1
+            if state.failures >= self.down_after and state.status != "down":
+                self.emit(endpoint, state, "down", str(e) or type(e).__name__)
+            return
+
+        status, block = parsed
+        state.failures = 0
+        if status == "synced" and block is not None and state.block is not None and block <= state.block:
+            # A synced node whose head does not move is falling behind
+            state.stalled_polls += 1
+            if state.stalled_polls >= self.stall_after:
+                status = "stalled"
+        else:
+            state.stalled_polls = 0
+        if block is not None:
+            state.block = block
+        if status != state.status:
+            self.emit(endpoint, state, status)
+
+    def next_due(self, now):
+        return now + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def run(self, rounds=None):
+        """Poll every endpoint on its own jittered schedule; stop after `rounds` polls each if given"""
+        self.pool = ConnectionPool(self.max_connections, self.timeout)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Spread the first polls over one interval so they do not arrive in a burst
+        schedule = [(now + random.uniform(0, self.interval), 1, endpoint) for endpoint in self.states]
+        heapq.heapify(schedule)
+        tasks = set()
+        try:
+            while schedule:
+                due, round_no, endpoint = heapq.heappop(schedule)
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(self.poll(endpoint, self.states[endpoint]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if rounds is None or round_no < rounds:
+                    heapq.heappush(schedule, (self.next_due(due), round_no + 1, endpoint))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.pool.close()
+
+    def print_summary(self):
+        counts = {}
+        for state in self.states.values():
+            counts[state.status] = counts.get(state.status, 0) + 1
+        polls = sum(state.polls for state in self.states.values())
+        print(f"\n{'='*50}")
+        print(f"WATCH SUMMARY")
+        print(f"{'='*50}")
+        print(f"Endpoints: {len(self.states)} (" + ", ".join(f"{name}={count}" for name, count in sorted(counts.items())) + ")")
+        print(f"Polls: {polls}, status changes: {self.events}")
+        if self.pool is not None:
+            print(f"Connections opened: {self.pool.opened}, reused: {self.pool.reused}")
+
+def watch_command(args):
+    nodes, _ = load_result_file(args.results)
+    unique = list({(node["ip"], node["port"]): node for node in nodes}.values())
+    sink = JsonlResultSink(args.events_file, append=True)
+    watcher = EndpointWatcher(unique, interval=args.interval, jitter=args.jitter,
+                              max_connections=args.max_connections, timeout=args.timeout,
+                              down_after=args.down_after, stall_after=args.stall_after, sink=sink)
+    print(f"Watching {len(unique)} endpoint(s) from {args.results} every {args.interval:g}s "
+          f"(±{args.jitter:.0%}), at most {args.max_connections} connections")
+    print(f"Status changes are appended to: {args.events_file}")
+    try:
+        asyncio.run(watcher.run(args.rounds))
+    except KeyboardInterrupt:
+        print("\n👋 Watch stopped")
+    finally:
+        sink.close()
+    watcher.print_summary()
+
+def add_watch_arguments(watch):
+    watch.add_argument("results", help="JSON results or JSON Lines stream of endpoints to watch")
+    watch.add_argument("--interval", type=float, default=60, help="Seconds between polls of each endpoint")
+    watch.add_argument("--jitter", type=float, default=0.1, help="Random spread of the interval (0.1 = ±10%%)")
+    watch.add_argument("--max-connections", type=int, default=256,
+                       help="Keep-alive connections held open at most")
+    watch.add_argument("--timeout", type=float, default=5, help="Connect and response timeout in seconds")
+    watch.add_argument("--down-after", type=int, default=2, help="Failed polls before a node is reported down")
+    watch.add_argument("--stall-after", type=int, default=3,
+                       help="Polls without a new block before a synced node is reported stalled")
+    watch.add_argument("--events-file", default="watch_events.jsonl", help="JSON Lines file of status changes")
+    watch.add_argument("--rounds", type=int, help="Stop after polling every endpoint this many times")
+    watch.set_defaults(func=watch_command)
+
+def add_watch_command(subparsers):
+    """Register the `watch` subcommand on an argparse subparsers object"""
+    add_watch_arguments(subparsers.add_parser(
+        "watch", help="Keep polling endpoints from a results file for status changes"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch known Ethereum endpoints for status changes")
+    add_watch_arguments(parser)
+    watch_command(parser.parse_args())
+
+if __name__ == "__main__":
+    main()